@@ -0,0 +1,62 @@
+# coding: utf8
+
+""" Benchmark of parsing and cleaning the UCI_AirQuality data without cache.
+
+Usage
+----------
+python benchmarks/bench_airquality.py [n_repeat]
+
+Compares the cleaning of handler_UCI_AirQuality (decimal comma handled by
+read_csv, one combined mask for the missing values) with the previous
+implementation, which filtered the DataFrame once per column and converted
+the decimal commas cell by cell. Both results are checked to be equal.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import handler_UCI_AirQuality as handler
+
+
+def legacy():
+    data = pd.read_csv(handler.basepath + '/UCI_AirQuality/AirQualityUCI.csv',
+                       sep=';', nrows=9357,
+                       usecols=['CO(GT)', 'PT08.S1(CO)', 'C6H6(GT)',
+                                'PT08.S2(NMHC)', 'NOx(GT)', 'PT08.S3(NOx)',
+                                'NO2(GT)', 'PT08.S4(NO2)', 'PT08.S5(O3)',
+                                'T', 'RH', 'AH'])
+    for col in data.columns.tolist():
+        data = data[data[col] != -200]
+        if col in ['CO(GT)', 'C6H6(GT)', 'T', 'RH', 'AH']:
+            data = data.copy()
+            data[col] = data[col].apply(lambda x: x.replace(',', '.'))
+            data[col] = pd.to_numeric(data[col])
+    return data
+
+
+def vectorized():
+    return handler.read_all(return_type='pd', cache=False, memo=False)
+
+
+def main(n_repeat=20):
+    pd.testing.assert_frame_equal(legacy(), vectorized())
+    times = {}
+    for name, fun in [('legacy', legacy), ('vectorized', vectorized)]:
+        times[name] = []
+        for _ in range(n_repeat):
+            start = time.time()
+            fun()
+            times[name].append(time.time() - start)
+        print("{0:>12s}: {1:7.2f} ms".format(name, 1e3 * min(times[name])))
+    print("{0:>12s}: {1:7.1f}x".format(
+        'speedup', min(times['legacy']) / min(times['vectorized'])))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
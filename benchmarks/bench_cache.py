@@ -0,0 +1,48 @@
+# coding: utf8
+
+""" Benchmark of cold (parsing the source) and warm (binary cache, see
+datacache) loads of the tabular handlers.
+
+Usage
+----------
+python benchmarks/bench_cache.py [name ...]
+
+For every given data set (default: all tabular ones), the cache entry is
+removed, read_all is timed once (cold) and then n_repeat times (warm).
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import db_hand
+
+# Data sets without parsed source files
+__exclude__ = ['CroppedYaleFacesB', 'UCI_Boston']
+
+
+def main(names=None, n_repeat=5):
+    for name in names or [name for name in db_hand.names()
+                          if name not in __exclude__]:
+        try:
+            db_hand.invalidate(name)
+            start = time.time()
+            db_hand.load(name, memo=False)
+            cold = time.time() - start
+            warm = []
+            for _ in range(n_repeat):
+                start = time.time()
+                db_hand.load(name, memo=False)
+                warm.append(time.time() - start)
+        except Exception as e:
+            print("{0:>32s}: failed ({1}: {2})".format(name, type(e).__name__, e))
+            continue
+        print("{0:>32s}: cold {1:9.1f} ms, warm {2:7.1f} ms, speedup {3:7.1f}x"
+              .format(name, 1e3 * cold, 1e3 * min(warm), cold / min(warm)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,75 @@
+# coding: utf8
+
+""" Import time benchmark of db_hand and the handlers based on
+python -X importtime.
+
+Usage
+----------
+python benchmarks/bench_import.py [name ...]
+
+For db_hand itself and for every given data set (default: all), a fresh
+interpreter imports the module and the cumulative import time and the
+number of imported modules are reported. Fails if matplotlib is imported.
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+
+basepath = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, basepath)
+import db_hand
+
+
+def importtime(statement):
+    """ Runs statement in a fresh interpreter with -X importtime and returns
+    a dict mapping each imported module to its cumulative import time in
+    microseconds. """
+    proc = subprocess.Popen([sys.executable, '-X', 'importtime', '-c',
+                             statement], cwd=basepath,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    _, err = proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(err)
+    modules = {}
+    for line in err.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = [item.strip() for item in
+                                 line[len('import time:'):].split('|')]
+        modules[module.strip()] = int(cumulative)
+    return modules
+
+
+def main(names=None):
+    statements = [('db_hand', 'import db_hand')]
+    for name in names or db_hand.names():
+        statements.append((name, "import db_hand; db_hand.get_handler('{0}')"
+                           .format(name)))
+    failed = False
+    for label, statement in statements:
+        try:
+            modules = importtime(statement)
+        except RuntimeError as e:
+            errors = [line for line in str(e).splitlines() if 'Error' in line]
+            print("{0:>32s}: import failed ({1})".format(
+                label, (errors or ['unknown error'])[-1].strip()))
+            failed = True
+            continue
+        top = [module for module in modules if '.' not in module]
+        total = sum(modules[module] for module in top)
+        print("{0:>32s}: {1:8.1f} ms, {2:4d} modules".format(
+            label, total / 1e3, len(modules)))
+        if 'matplotlib' in modules:
+            print("{0:>32s}  imports matplotlib".format(''))
+            failed = True
+    if 'pandas' in importtime('import db_hand'):
+        print("import db_hand imports pandas")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,46 @@
+# coding: utf8
+
+""" Benchmark of loading all tabular data sets with db_hand.load_suite in a
+process pool against loading them one after another.
+
+Usage
+----------
+python benchmarks/bench_load_suite.py [processes]
+
+Both runs parse the sources (cache = False, memo = False) of the default
+data sets of load_suite.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import db_hand
+
+
+def main(processes=None):
+    start = time.time()
+    serial, serial_times = db_hand.load_suite(processes=1, cache=False,
+                                              memo=False)
+    t_serial = time.time() - start
+    start = time.time()
+    parallel, times = db_hand.load_suite(processes=processes, cache=False,
+                                         memo=False)
+    t_parallel = time.time() - start
+    for name in serial:
+        assert all(np.array_equal(a, b, equal_nan=True)
+                   for a, b in zip(serial[name], parallel[name]))
+        print("{0:>32s}: {1:8.1f} ms".format(name, 1e3 * times[name]))
+    print("serial {0:.2f} s (sum of loads {1:.2f} s), parallel {2:.2f} s "
+          "(slowest load {3:.2f} s)".format(
+              t_serial, sum(serial_times.values()), t_parallel,
+              max(times.values())))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,116 @@
+# coding: utf8
+
+""" Benchmark of the PGM decoder in handler_CroppedYaleFacesB against the
+former byte-at-a-time decoder.
+
+Usage
+----------
+python benchmarks/bench_pgm.py [n_repeat]
+
+Uses yaleB01_P00A-070E+00.pgm if the Cropped Yale Face Database B is present,
+otherwise a synthetic 192x168 face with a commented header is generated.
+Also checks that a synthetic 16 bit PGM (maxval > 255, values above 32767)
+is read exactly and that converting it raises a ValueError instead of
+wrapping values around.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import handler_CroppedYaleFacesB as yale
+
+
+def read_pgm_legacy(pgmf):
+    """ Former decoder: one read(1) and ord() call per pixel. """
+    assert pgmf.readline() == b'P5\n'
+    (width, height) = [int(i) for i in pgmf.readline().split()]
+    depth = int(pgmf.readline())
+    assert depth <= 255
+    raster = []
+    for y in range(height):
+        row = []
+        for y in range(width):
+            row.append(ord(pgmf.read(1)))
+        raster.append(row)
+    return raster
+
+
+def _synthetic_pgm(dirname, height=192, width=168):
+    fn = os.path.join(dirname, 'synthetic.pgm')
+    raster = np.random.RandomState(0).randint(0, 256, (height, width))
+    with open(fn, 'wb') as f:
+        f.write('P5\n{0} {1}\n255\n'.format(width, height).encode('ascii'))
+        f.write(raster.astype('u1').tobytes())
+    return fn
+
+
+def _synthetic_pgm16(dirname, height=192, width=168, maxval=65535):
+    fn = os.path.join(dirname, 'synthetic16.pgm')
+    raster = np.random.RandomState(0).randint(0, maxval + 1, (height, width))
+    with open(fn, 'wb') as f:
+        f.write('P5\n# 16 bit\n{0} {1}\n{2}\n'.format(
+            width, height, maxval).encode('ascii'))
+        f.write(raster.astype('>u2').tobytes())
+    return fn, raster
+
+
+def check_16bit():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fn, raster = _synthetic_pgm16(tmpdir)
+        assert raster.max() > np.iinfo(np.int16).max
+        for mmap in [False, True]:
+            assert np.array_equal(yale.read_pgm_filename(fn, mmap=mmap), raster)
+        for dtype in [None, np.float32, np.uint8]:
+            try:
+                yale.read_single_filename(fn, 0.5, dtype=dtype)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError("16 bit image was converted.")
+    finally:
+        for item in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, item))
+        os.rmdir(tmpdir)
+    print("    16 bit: raw values exact, conversion refused")
+
+
+def main(n_repeat=20):
+    fn = yale.basepath + '/CroppedYaleFaces/yaleB01/yaleB01_P00A-070E+00.pgm'
+    tmpdir = None
+    if not os.path.isfile(fn):
+        tmpdir = tempfile.mkdtemp()
+        fn = _synthetic_pgm(tmpdir)
+
+    def legacy():
+        with open(fn, 'rb') as f:
+            return np.array(read_pgm_legacy(f)).astype('int16')
+
+    def vectorized():
+        return yale.read_pgm_filename(fn).astype('int16')
+
+    def memmapped():
+        return yale.read_pgm_filename(fn, mmap=True).astype('int16')
+
+    assert np.array_equal(legacy(), vectorized())
+    assert np.array_equal(legacy(), memmapped())
+    t_legacy = min(timeit.repeat(legacy, number=1, repeat=n_repeat))
+    for name, func in [('frombuffer', vectorized), ('memmap', memmapped)]:
+        t = min(timeit.repeat(func, number=1, repeat=n_repeat))
+        print("{0:>10s}: {1:9.3f} ms (legacy {2:9.3f} ms, speedup {3:7.1f}x)".format(
+            name, 1e3 * t, 1e3 * t_legacy, t_legacy / t))
+    if tmpdir is not None:
+        os.remove(fn)
+        os.rmdir(tmpdir)
+    check_16bit()
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,83 @@
+# coding: utf8
+
+""" Benchmark of the batched conversion and rescaling of the Cropped Yale Face
+Database B (read_all(batched=True)) against the per-image skimage path.
+
+Usage
+----------
+python benchmarks/bench_rescale.py [scale] [workers]
+
+Also checks that the process pool (workers > 1) returns exactly the same
+values as the serial default path. Uses the database if present, otherwise a synthetic database of 4 subjects
+with 64 random 192x168 faces each is generated.
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import handler_CroppedYaleFacesB as yale
+
+
+def _synthetic_database(dirname, n_subjects=4, height=192, width=168):
+    random_state = np.random.RandomState(0)
+    for nr in range(1, n_subjects + 1):
+        folder = os.path.join(dirname, 'CroppedYaleFaces',
+                              'yaleB{0}'.format(str(nr).zfill(2)))
+        os.makedirs(folder)
+        for i in range(64):
+            fn = os.path.join(folder, 'yaleB{0}_P00A{1:+04d}E{2:+03d}.pgm'.format(
+                str(nr).zfill(2), 5 * (i % 16) - 40, 10 * (i // 16)))
+            with open(fn, 'wb') as f:
+                f.write('P5\n{0} {1}\n255\n'.format(width, height).encode('ascii'))
+                f.write(random_state.randint(0, 256, (height, width)).astype(
+                    'u1').tobytes())
+
+
+def _timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def main(scale=0.25, workers=2):
+    tmpdir = None
+    if not os.path.isdir(yale.basepath + '/CroppedYaleFaces'):
+        tmpdir = tempfile.mkdtemp()
+        _synthetic_database(tmpdir)
+        yale.basepath = tmpdir
+    try:
+        reference, t_single = _timed(lambda: yale.read_all(scale, batched=False,
+                                                             memo=False))
+        # First batched call includes building the resampling matrices
+        _, t_cold = _timed(lambda: yale.read_all(scale, batched=True,
+                                                 memo=False))
+        batched, t_batched = _timed(lambda: yale.read_all(scale, batched=True,
+                                                          memo=False))
+        for nr in reference:
+            assert np.allclose(reference[nr], batched[nr], rtol=0, atol=1e-12)
+        pooled, t_pooled = _timed(lambda: yale.read_all(scale,
+                                                        workers=workers,
+                                                        memo=False))
+        for nr in reference:
+            assert np.array_equal(batched[nr], pooled[nr]), \
+                "workers = {0} differs from workers = 1.".format(workers)
+        print("per-image: {0:8.3f} s".format(t_single))
+        print("  batched: {0:8.3f} s (cold {1:.3f} s), speedup {2:.1f}x".format(
+            t_batched, t_cold, t_single / t_batched))
+        print("   pooled: {0:8.3f} s ({1} workers, equal to batched)".format(
+            t_pooled, workers))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(*[float(a) for a in sys.argv[1:2]] + [int(a) for a in sys.argv[2:3]])
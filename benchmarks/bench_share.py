@@ -0,0 +1,94 @@
+# coding: utf8
+
+""" Benchmark of sharing read_all results between worker processes (see
+datashare).
+
+Usage
+----------
+python benchmarks/bench_share.py [n_workers]
+
+Every worker of a process pool loads the California Housing data, first
+with parsing in each worker, then with sharing enabled. With sharing the
+data is parsed once and all workers map the same files. Checks that all
+workers get the same values, that the data is published once and that
+cleanup() removes the files after the workers exited.
+"""
+from __future__ import print_function
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import datashare
+import handler_CaliforniaHousing as handler
+
+
+def _load(share):
+    datashare.enable(share)
+    start = time.time()
+    data = handler.read_all(cache=False)
+    return (time.time() - start, float(data.sum()), isinstance(data, np.memmap))
+
+
+def _counting(publish):
+    def wrapper(result, meta, folder):
+        with open(os.path.join(datashare.sharepath, 'publish.log'), 'a') as f:
+            f.write('{0}\n'.format(os.getpid()))
+        return publish(result, meta, folder)
+    return wrapper
+
+
+def _run(n_workers, share):
+    pool = multiprocessing.Pool(n_workers)
+    try:
+        start = time.time()
+        results = pool.map(_load, [share] * n_workers, chunksize=1)
+        return results, time.time() - start
+    finally:
+        pool.close()
+        pool.join()
+
+
+def main(n_workers=8):
+    sharepath = tempfile.mkdtemp()
+    datashare.sharepath = sharepath
+    datashare._publish = _counting(datashare._publish)
+    try:
+        for share in [False, True]:
+            results, elapsed = _run(n_workers, share)
+            assert len(set(checksum for _, checksum, _ in results)) == 1
+            assert all(mapped == share for _, _, mapped in results)
+            print("{0:>8s}: {1:7.3f} s wall, {2:7.3f} s max per worker".format(
+                'shared' if share else 'parsed', elapsed,
+                max(t for t, _, _ in results)))
+        with open(os.path.join(sharepath, 'publish.log')) as f:
+            assert len(f.readlines()) == 1, "Data was published twice."
+        # Pool workers exit without atexit, their references are dead now
+        assert len(datashare.published()) == 1
+        datashare.cleanup()
+        assert datashare.published() == [], "Shared files were not removed."
+
+        # Results referenced by dead processes are removed by cleanup()
+        datashare.enable()
+        datashare.load('leftover', lambda: np.arange(10.))
+        datashare._references.clear()
+        open(os.path.join(sharepath, 'leftover', 'refs', '999999999'),
+             'w').close()
+        os.remove(os.path.join(sharepath, 'leftover', 'refs',
+                               str(os.getpid())))
+        assert datashare.published() == ['leftover']
+        datashare.cleanup()
+        assert datashare.published() == []
+    finally:
+        shutil.rmtree(sharepath, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
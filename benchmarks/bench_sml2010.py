@@ -0,0 +1,55 @@
+# coding: utf8
+
+""" Benchmark of parsing the UCI_SML2010 data (both files) without cache.
+
+Usage
+----------
+python benchmarks/bench_sml2010.py [n_repeat]
+
+Compares the single pass parse of handler_UCI_SML2010 with a straightforward
+loader, which reads each file into its own DataFrame with inferred dtypes,
+concatenates them and converts Date and Time afterwards.
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import handler_UCI_SML2010 as handler
+
+
+def naive():
+    frames = [pd.read_csv(handler.basepath + handler.__splits__[nr], sep='\t')
+              for nr in [1, 2]]
+    data = pd.concat(frames, ignore_index=True)
+    data.columns = [name.split(':', 1)[1] for name in data.columns]
+    data.index = pd.to_datetime(data['Date'] + ' ' + data['Time'],
+                                format='%d/%m/%Y %H:%M')
+    data = data.drop(['Date', 'Time'] + handler.__exclude_features__, axis=1)
+    cols = [c for c in data.columns if c != 'Temperature_Comedor_Sensor']
+    return data[cols + ['Temperature_Comedor_Sensor']].values.astype(np.float64)
+
+
+def fast():
+    return handler.read_all(cache=False, memo=False)
+
+
+def main(n_repeat=20):
+    assert np.array_equal(naive(), fast())
+    for name, fun in [('naive', naive), ('single pass', fast)]:
+        times = []
+        for _ in range(n_repeat):
+            start = time.time()
+            fun()
+            times.append(time.time() - start)
+        print("{0:>12s}: {1:7.2f} ms".format(name, 1e3 * min(times)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
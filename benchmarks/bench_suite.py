@@ -0,0 +1,212 @@
+# coding: utf8
+
+""" Load time and throughput benchmark of read_all of all handlers.
+
+Usage
+----------
+python benchmarks/bench_suite.py [name ...] [--repeat N] [--scales S ...]
+    [--history FILE] [--baseline FILE] [--save-baseline FILE]
+    [--tolerance T]
+
+Every tabular data set (default: all, see db_hand.names()) is loaded with
+every scaling ('None', 'MinMax', 'MeanVar') and both return types ('np',
+'pd'), the Cropped Yale Face Database B at the given scales (default 0.125,
+0.25 and 0.5, layout = 'tensor'). For every case the following is timed,
+always bypassing the memo (see datamemo):
+
+    cold    First parse of the source after removing the cached data.
+    warm    Best of n_repeat parses with the source files in the OS cache.
+    cached  Best of n_repeat loads from the binary cache (see datacache, for
+            Yale load_compiled). Equals warm for handlers without cache.
+
+rows/s and bytes/s refer to warm, bytes are the size of the source files in
+the data folders of the handler (read_all.folders).
+
+The results of a run are appended to the JSON history (default
+benchmarks/history.json) as one record {'time', 'environment', 'results'}.
+If a baseline (a file written by --save-baseline) is given, cold and warm of
+every case are compared with it and the script exits with status 1 if a case
+is slower than (1 + tolerance) times the baseline.
+"""
+from __future__ import print_function
+
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+import db_hand
+
+__scalings__ = ['None', 'MinMax', 'MeanVar']
+__return_types__ = ['np', 'pd']
+__image_handlers__ = ['CroppedYaleFacesB']
+__versioned__ = ['numpy', 'pandas', 'scipy', 'sklearn', 'skimage', 'openpyxl',
+                 'xlrd']
+
+
+def cases(names, scales):
+    """ Yields the (name, options of read_all) of all benchmarked cases. """
+    for name in names:
+        if name in __image_handlers__:
+            for scale in scales:
+                yield name, {'scale': scale, 'layout': 'tensor'}
+        else:
+            for scaling in __scalings__:
+                for return_type in __return_types__:
+                    yield name, {'return_type': return_type, 'scaling': scaling}
+
+
+def measure(name, opts, n_repeat=3):
+    """ Returns the timings (in seconds) and throughput of loading the data
+    set name with the given options, see the module docstring. """
+    read_all = db_hand.get_handler(name).read_all
+    has_cache = 'cache' in inspect.signature(read_all).parameters
+    if has_cache:
+        parse = dict(opts, cache=False, memo=False)
+        cached = dict(opts, cache=True, memo=False)
+    else:
+        parse = cached = dict(opts, memo=False)
+
+    db_hand.invalidate(name)
+    result, cold = _timed(lambda: read_all(**parse))
+    warm = min(_timed(lambda: read_all(**parse))[1] for _ in range(n_repeat))
+    if has_cache:
+        # Writes the cache entry
+        _timed(lambda: read_all(**cached))
+        cached_time = min(_timed(lambda: read_all(**cached))[1]
+                          for _ in range(n_repeat))
+    else:
+        cached_time = warm
+    rows = _rows(result)
+    size = _source_bytes(read_all)
+    return {'name': name, 'options': opts, 'cold': cold, 'warm': warm,
+            'cached': cached_time, 'rows': rows, 'bytes': size,
+            'rows_per_s': rows / warm, 'bytes_per_s': size / warm or None}
+
+
+def compare(results, baseline, tolerance=0.25):
+    """ Returns the list of (case, measure, ratio) of all cases whose cold or
+    warm time exceeds (1 + tolerance) times the one in baseline. """
+    reference = dict((_case(entry), entry) for entry in baseline['results']
+                     if 'error' not in entry)
+    regressions = []
+    for entry in results:
+        base = reference.get(_case(entry))
+        if base is None or 'error' in entry:
+            continue
+        for measure_name in ['cold', 'warm']:
+            ratio = entry[measure_name] / base[measure_name]
+            if ratio > 1 + tolerance:
+                regressions.append((_case(entry), measure_name, ratio))
+    return regressions
+
+
+def environment():
+    """ Returns the python, platform and package versions of this run. """
+    versions = {}
+    for module in __versioned__:
+        try:
+            versions[module] = getattr(__import__(module), '__version__', '?')
+        except ImportError:
+            versions[module] = None
+    return {'python': platform.python_version(),
+            'platform': platform.platform(), 'packages': versions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('names', nargs='*', help="data sets, default all")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scales', type=float, nargs='+',
+                        default=[0.125, 0.25, 0.5])
+    parser.add_argument('--history', default=os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), 'history.json'))
+    parser.add_argument('--baseline')
+    parser.add_argument('--save-baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    names = [db_hand.resolve(name) for name in args.names] or db_hand.names()
+    results = []
+    for name, opts in cases(names, args.scales):
+        try:
+            # Silences the progress output of the image handlers
+            with contextlib.redirect_stdout(io.StringIO()):
+                entry = measure(name, opts, args.repeat)
+        except Exception as e:
+            # RuntimeError: options not supported by the handler
+            entry = {'name': name, 'options': opts, 'error': '{0}: {1}'.format(
+                type(e).__name__, str(e).strip().split('\n')[0])}
+            print("{0:>64s}: {1} ({2})".format(
+                _case(entry), 'unsupported' if isinstance(e, RuntimeError)
+                else 'failed', entry['error']))
+        else:
+            print("{0:>64s}: cold {1:8.1f} ms, warm {2:8.1f} ms, cached "
+                  "{3:7.1f} ms, {4:9.0f} rows/s, {5:6.1f} MB/s".format(
+                      _case(entry), 1e3 * entry['cold'], 1e3 * entry['warm'],
+                      1e3 * entry['cached'], entry['rows_per_s'],
+                      (entry['bytes_per_s'] or 0) / 1e6))
+        results.append(entry)
+
+    record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'environment': environment(), 'results': results}
+    history = []
+    if os.path.isfile(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+    history.append(record)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=1)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(record, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for case, measure_name, ratio in regressions:
+            print("Regression {0}: {1} {2:.2f}x of baseline".format(
+                case, measure_name, ratio))
+        if regressions:
+            return 1
+    return 0
+
+
+def _timed(func):
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def _case(entry):
+    return '{0}({1})'.format(entry['name'], ', '.join(
+        '{0}={1}'.format(key, entry['options'][key])
+        for key in sorted(entry['options'])))
+
+
+def _rows(result):
+    if isinstance(result, tuple):
+        # Yale layout = 'tensor': (data, subject of every image)
+        return len(result[-1])
+    return result.shape[0]
+
+
+def _source_bytes(read_all):
+    size = 0
+    for folder in read_all.folders():
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if d[0] not in '_.']
+            size += sum(os.path.getsize(os.path.join(root, fn))
+                        for fn in files if fn[0] not in '_.')
+    return size
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+# coding: utf8
+
+""" Binary columnar cache of the parsed and cleaned data of the tabular
+handlers.
+
+Remarks
+----------
+Parsing the source files (in particular .xls/.xlsx files) is by far the most
+expensive part of read_all. Therefore each tabular handler parses and cleans
+its source once and stores the resulting DataFrame column by column as .npy
+files. Later calls load these files instead of parsing the source again.
+
+An entry is identified by the handler, the handler's __cache_version__ and
+the options that influence parsing. It is only used as long as the SHA1 hashes
+of the source files match the ones it was built from, otherwise it is rebuilt.
+The cache is stored in the folder cachepath, which defaults to the folder
+_cache next to the handlers and can be set by the environment variable
+DB_HAND_CACHE. If the folder is not writable, data is parsed without caching.
+
+Entries built ahead of time by 'python -m db_hand build' (see db_hand.build)
+are looked up first in the folder artifactpath (default _artifacts next to
+the handlers, environment variable DB_HAND_ARTIFACTS) through its
+manifest.json. They are used without the source files, so deployments
+without the sources and without the parsing dependencies (e.g. openpyxl,
+xlrd) only read .npy files. If a source file is present and differs from the
+one the artifact was built from, the artifact is ignored.
+
+Layout of an entry
+----------
+<cachepath>/<handler>/<options hash>/<source hash>/
+    meta.json       column names, dtypes and storage kinds
+    c<i>.npy        values of column i
+    c<i>_na.npy     missing value mask of string column i
+    c<i>_cat.npy    categories of categorical column i (c<i>.npy holds codes)
+    index.npy       row index, if it is not the default range index
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+import datatrace
+
+# Get basepath such that only relatives paths matter from this folder on
+basepath = os.path.dirname(os.path.realpath(__file__))
+
+cachepath = os.environ.get('DB_HAND_CACHE', os.path.join(basepath, '_cache'))
+
+artifactpath = os.environ.get('DB_HAND_ARTIFACTS',
+                              os.path.join(basepath, '_artifacts'))
+
+# Version of the layout of manifest.json in artifactpath
+__manifest_format__ = 1
+
+# SHA1 of source files per (filename, size, mtime), see file_hash
+_file_hashes = {}
+# Entries used by cached_frame per folder, see recorded
+_recorded = {}
+# (manifest filename, mtime, {(handler, options hash): entry}), see _artifact
+_manifest = [None, None, {}]
+
+
+def cached_frame(handler, sources, parse, version=1, options=None,
+                 cache=True, rebuild=False):
+    """ Returns the DataFrame created by parse, either from the cache or by
+    calling parse and storing its result in the cache.
+
+    Parameters
+    --------------
+    handler : string
+        Name of the handler module, e.g. 'handler_UCI_Concrete'.
+
+    sources : list of strings
+        Filenames of all source files read by parse.
+
+    parse : callable
+        Function without arguments returning the parsed and cleaned DataFrame.
+
+    version : Integer
+        Version of the parsing code of the handler. Increase it whenever parse
+        changes its result, such that old entries are not used anymore.
+
+    options : dict or None
+        Options influencing the result of parse.
+
+    cache : Boolean
+        If False, parse is called without using the cache at all.
+
+    rebuild : Boolean
+        If True, an existing entry is ignored and overwritten.
+
+    Returns
+    -------------
+    The DataFrame returned by parse or an equal DataFrame loaded from the
+    cache.
+    """
+    if not cache:
+        with datatrace.stage('parse') as stage:
+            return stage.done(parse())
+    options_key = _hash([version, sorted((options or {}).items())])
+    artifact = None if rebuild else _artifact(handler, options_key)
+    if artifact is not None:
+        try:
+            with datatrace.stage('load') as stage:
+                return stage.done(read_frame(artifact), artifact=True)
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+    source_key = _hash([file_hash(fn) for fn in sources])
+    parent = os.path.join(cachepath, handler, options_key)
+    folder = os.path.join(parent, source_key)
+    entry = {'handler': handler, 'options': options or {},
+             'version': version, 'key': options_key,
+             'sources': dict((os.path.relpath(fn, basepath), file_hash(fn))
+                             for fn in sources),
+             'path': os.path.relpath(folder, cachepath)}
+    if not rebuild and os.path.isfile(os.path.join(folder, 'meta.json')):
+        try:
+            with datatrace.stage('load') as stage:
+                data = stage.done(read_frame(folder))
+            _recorded[folder] = entry
+            return data
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+    with datatrace.stage('parse') as stage:
+        data = stage.done(parse())
+    try:
+        # Remove entries of older source files with the same options
+        if os.path.isdir(parent):
+            shutil.rmtree(parent)
+        with datatrace.stage('store') as stage:
+            write_frame(stage.done(data), folder)
+        _recorded[folder] = entry
+    except (IOError, OSError):
+        # Read-only or full disk, data is still returned
+        pass
+    return data
+
+
+def recorded(reset=False):
+    """ Returns the entries (dicts with handler, options, version, key,
+    sources and path relative to cachepath) loaded or written by
+    cached_frame in this process. If reset, the list is emptied. """
+    entries = list(_recorded.values())
+    if reset:
+        _recorded.clear()
+    return entries
+
+
+def invalidate(handler=None):
+    """ Removes all cache entries of the given handler module name, e.g.
+    'handler_UCI_Concrete', or of all handlers if handler is None. """
+    folder = cachepath if handler is None else os.path.join(cachepath, handler)
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+
+
+def file_hash(fn):
+    """ Returns the SHA1 hash of the content of the given file. Hashes are
+    kept per process as long as size and modification time do not change. """
+    stat = os.stat(fn)
+    key = (os.path.realpath(fn), stat.st_size, stat.st_mtime)
+    if key not in _file_hashes:
+        sha1 = hashlib.sha1()
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        _file_hashes[key] = sha1.hexdigest()
+    return _file_hashes[key]
+
+
+def write_frame(data, folder):
+    """ Stores the DataFrame data column by column as .npy files in folder.
+    The folder is written under a temporary name and renamed at the end, so
+    readers never see partially written entries. """
+    import pandas as pd
+    tmp = folder + '.tmp{0}'.format(os.getpid())
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    meta = {'columns': [], 'dtypes': [], 'kinds': [], 'index': None}
+    for i in range(data.shape[1]):
+        column = data.iloc[:, i]
+        name = data.columns[i]
+        meta['columns'].append(name.item() if isinstance(name, np.generic)
+                               else name)
+        meta['dtypes'].append(str(column.dtype))
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # Integer codes plus vocabulary, see read_frame
+            meta['kinds'].append('category')
+            meta['dtypes'][-1] = 'ordered' if column.cat.ordered else 'category'
+            categories = column.cat.categories.to_numpy()
+            if categories.dtype.kind not in 'biufcmM':
+                categories = categories.astype('U')
+            np.save(os.path.join(tmp, 'c{0}_cat.npy'.format(i)), categories)
+            np.save(os.path.join(tmp, 'c{0}.npy'.format(i)),
+                    column.cat.codes.to_numpy())
+            continue
+        values = column.to_numpy()
+        if values.dtype.kind in 'biufcmM':
+            meta['kinds'].append('array')
+        else:
+            # Strings are stored as fixed width unicode plus missing mask
+            meta['kinds'].append('string')
+            missing = pd.isna(column).to_numpy()
+            values = np.where(missing, '', column.astype(object).to_numpy()
+                              ).astype('U')
+            np.save(os.path.join(tmp, 'c{0}_na.npy'.format(i)), missing)
+        np.save(os.path.join(tmp, 'c{0}.npy'.format(i)), values)
+    if not isinstance(data.index, pd.RangeIndex) or \
+            not data.index.equals(pd.RangeIndex(len(data))):
+        meta['index'] = str(data.index.dtype)
+        meta['index_name'] = data.index.name
+        values = data.index.to_numpy()
+        if values.dtype.kind not in 'biufcmM':
+            # E.g. names of the rows, stored as fixed width unicode
+            values = values.astype('U')
+        np.save(os.path.join(tmp, 'index.npy'), values)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+    os.rename(tmp, folder)
+
+
+def read_frame(folder):
+    """ Loads a DataFrame stored by write_frame from folder. """
+    import pandas as pd
+    with open(os.path.join(folder, 'meta.json')) as f:
+        meta = json.load(f)
+    index = None
+    if meta['index'] is not None:
+        index = np.load(os.path.join(folder, 'index.npy'))
+        if index.dtype.kind == 'U':
+            index = pd.Index(index.astype(object), dtype=meta['index'])
+        index = pd.Index(index, name=meta.get('index_name'))
+    columns = {}
+    for i, (dtype, kind) in enumerate(zip(meta['dtypes'], meta['kinds'])):
+        values = np.load(os.path.join(folder, 'c{0}.npy'.format(i)))
+        if kind == 'string':
+            missing = np.load(os.path.join(folder, 'c{0}_na.npy'.format(i)))
+            values = values.astype(object)
+            values[missing] = np.nan
+            columns[i] = pd.Series(values, index=index,
+                                   dtype=object).astype(dtype)
+        elif kind == 'category':
+            categories = np.load(os.path.join(folder,
+                                              'c{0}_cat.npy'.format(i)))
+            if categories.dtype.kind == 'U':
+                categories = categories.astype(object)
+            columns[i] = pd.Series(pd.Categorical.from_codes(
+                values, categories, ordered=dtype == 'ordered'), index=index)
+        else:
+            columns[i] = pd.Series(values, index=index)
+    data = pd.DataFrame(columns, index=index)
+    data.columns = meta['columns']
+    return data
+
+
+def _artifact(handler, options_key):
+    """ Returns the folder of the artifact of the handler and options hash in
+    artifactpath, or None if there is no valid one. """
+    if not artifactpath:
+        return None
+    fn = os.path.join(artifactpath, 'manifest.json')
+    try:
+        mtime = os.stat(fn).st_mtime
+    except OSError:
+        return None
+    if _manifest[:2] != [fn, mtime]:
+        entries = {}
+        try:
+            with open(fn) as f:
+                manifest = json.load(f)
+            if manifest.get('format') == __manifest_format__:
+                entries = dict(((entry['handler'], entry['key']), entry)
+                               for entry in manifest['entries'])
+        except (IOError, OSError, ValueError, KeyError):
+            pass
+        _manifest[:] = [fn, mtime, entries]
+    entry = _manifest[2].get((handler, options_key))
+    if entry is None:
+        return None
+    for name, sha1 in entry['sources'].items():
+        source = os.path.join(basepath, name)
+        if os.path.isfile(source) and file_hash(source) != sha1:
+            # Source changed since the build
+            return None
+    return os.path.join(artifactpath, entry['path'])
+
+
+def _hash(obj):
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=repr)
+                        .encode('utf8')).hexdigest()[:16]
@@ -0,0 +1,223 @@
+# coding: utf8
+
+""" Process-wide memo of the results of read_all.
+
+Remarks
+----------
+Handlers decorate read_all with memoized. The memo is disabled by default
+and enabled by the environment variable DB_HAND_MEMO=1 or enable(), or per
+call by memo = True (memo = False bypasses it). If enabled, results are kept
+in memory per handler, per value of every argument of read_all and per state
+(name, size, modification time) of the files in the data folders of the
+handler and their subfolders, so a changed source file is never served from
+the memo. Files and folders whose name starts with '_' or '.' (e.g. caches)
+are not considered.
+
+Arrays in memoized results are read-only (writeable = False), so they cannot
+be changed in place by one caller and seen by the next. DataFrames are
+returned as shallow copies, which pandas with copy-on-write keeps separate.
+Pass memo = False to read_all to bypass the memo, e.g. to get a writeable
+array.
+
+The memo is bounded by the total size of the stored arrays, maxbytes, which
+defaults to 256 MiB and can be set by the environment variable
+DB_HAND_MEMO_BYTES. The least recently used results are evicted first.
+Results larger than maxbytes are not stored. stats() returns hit, miss and
+eviction counters.
+
+If sharing is enabled (see datashare), the memo is used as well unless
+memo = False, and results missing in the memo are loaded from or published
+to the memory-mapped files shared by all processes.
+"""
+import collections
+import functools
+import inspect
+import os
+import threading
+
+import numpy as np
+
+import datashare
+import datatrace
+
+enabled = os.environ.get('DB_HAND_MEMO', '0') == '1'
+
+maxbytes = int(os.environ.get('DB_HAND_MEMO_BYTES', 1 << 28))
+
+# (handler, arguments, file states) -> (result, size in bytes), LRU first
+_entries = collections.OrderedDict()
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'uncacheable': 0}
+
+
+def memoized(folders):
+    """ Decorator of read_all of a handler.
+
+    Parameters
+    --------------
+    folders : callable
+        Function without arguments returning the data folders of the handler,
+        e.g. lambda: [basepath + '/UCI_Concrete']. It is called on every call
+        of read_all, so changes of basepath are taken into account. It is
+        also available as read_all.folders.
+    """
+    def decorator(read_all):
+        signature = inspect.signature(read_all)
+
+        @functools.wraps(read_all)
+        def wrapper(*args, **kwargs):
+            with datatrace.stage('read_all', read_all.__module__) as stage:
+                result, memo = call(*args, **kwargs)
+                return stage.done(result, memo=memo)
+
+        def call(*args, **kwargs):
+            """ Returns the result and how it was obtained from the memo. """
+            memo = kwargs.pop('memo', None)
+            if not (enabled or datashare.enabled if memo is None else memo):
+                return read_all(*args, **kwargs), 'off'
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            try:
+                key = (read_all.__module__,
+                       _freeze(sorted(bound.arguments.items())),
+                       _states(folders()))
+                hash(key)
+            except TypeError:
+                # E.g. arguments without hash, results are not memoized
+                with _lock:
+                    _stats['uncacheable'] += 1
+                return read_all(*args, **kwargs), 'uncacheable'
+            with _lock:
+                if key in _entries:
+                    _entries.move_to_end(key)
+                    _stats['hits'] += 1
+                    return _shallow_copy(_entries[key][0]), 'hit'
+                _stats['misses'] += 1
+            name = datashare.shareable_key(key) if datashare.enabled else None
+            if name is None:
+                result = _read_only(read_all(*args, **kwargs))
+            else:
+                result = _read_only(datashare.load(
+                    name, lambda: read_all(*args, **kwargs)))
+            _store(key, result)
+            return _shallow_copy(result), 'miss'
+        wrapper.folders = folders
+        return wrapper
+    return decorator
+
+
+def enable(flag=True):
+    """ Enables (or disables) the memo for calls of read_all without the
+    memo argument in this process. """
+    global enabled
+    enabled = flag
+
+
+def stats():
+    """ Returns a dict of the counters hits, misses, evictions and
+    uncacheable (calls with arguments that cannot be used as key) and the
+    current number of entries and bytes of the memo. """
+    with _lock:
+        result = dict(_stats)
+        result['entries'] = len(_entries)
+        result['bytes'] = sum(size for _, size in _entries.values())
+        result['maxbytes'] = maxbytes
+    return result
+
+
+def clear(handler=None):
+    """ Removes all results of the given handler module name, e.g.
+    'handler_UCI_Concrete', or all results if handler is None. Counters are
+    reset if handler is None. """
+    with _lock:
+        for key in list(_entries):
+            if handler is None or key[0] == handler:
+                del _entries[key]
+        if handler is None:
+            for name in _stats:
+                _stats[name] = 0
+
+
+def _store(key, result):
+    size = _nbytes(result)
+    if size > maxbytes:
+        return
+    with _lock:
+        _entries[key] = (result, size)
+        _entries.move_to_end(key)
+        total = sum(entry_size for _, entry_size in _entries.values())
+        while total > maxbytes:
+            _, (_, evicted) = _entries.popitem(last=False)
+            total -= evicted
+            _stats['evictions'] += 1
+
+
+def _states(folders):
+    """ Returns the (path, size, mtime) of all files in the folders and their
+    subfolders, e.g. every image of the Yale faces. """
+    states = []
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = sorted(d for d in dirs if d[0] not in '_.')
+            for fn in sorted(files):
+                if fn[0] in '_.':
+                    continue
+                stat = os.stat(os.path.join(root, fn))
+                states.append((root, fn, stat.st_size, stat.st_mtime))
+    return tuple(states)
+
+
+def _freeze(value):
+    """ Converts lists and dicts in arguments to tuples usable as key. """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    elif isinstance(value, dict):
+        return tuple(sorted((name, _freeze(item))
+                            for name, item in value.items()))
+    elif isinstance(value, type):
+        return value.__module__ + '.' + value.__name__
+    return value
+
+
+def _read_only(result):
+    """ Sets the writeable flag of all arrays in result to False. """
+    if isinstance(result, np.ndarray):
+        result.flags.writeable = False
+    elif isinstance(result, (list, tuple)):
+        for item in result:
+            _read_only(item)
+    elif isinstance(result, dict):
+        for item in result.values():
+            _read_only(item)
+    elif hasattr(result, 'indptr'):
+        # scipy.sparse matrices
+        for values in [result.data, result.indices, result.indptr]:
+            values.flags.writeable = False
+    return result
+
+
+def _shallow_copy(result):
+    if hasattr(result, 'iloc'):
+        return result.copy(deep=False)
+    elif isinstance(result, dict):
+        return dict((name, _shallow_copy(item))
+                    for name, item in result.items())
+    elif isinstance(result, tuple):
+        return tuple(_shallow_copy(item) for item in result)
+    return result
+
+
+def _nbytes(result):
+    """ Returns the memory used by the arrays of result. """
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    elif hasattr(result, 'memory_usage'):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    elif hasattr(result, 'indptr'):
+        return result.data.nbytes + result.indices.nbytes + \
+            result.indptr.nbytes
+    elif isinstance(result, (list, tuple)):
+        return sum(_nbytes(item) for item in result)
+    elif isinstance(result, dict):
+        return sum(_nbytes(item) for item in result.values())
+    return 0
@@ -0,0 +1,206 @@
+# coding: utf8
+
+""" Column-wise scaling shared by the handlers.
+
+Remarks
+----------
+The scaling options of read_all ('MinMax' to [-1, 1] and 'MeanVar' to zero
+mean and unit variance) are affine maps x -> (x - center) / width per column.
+fit computes center and width of the given columns in one vectorized pass
+(missing values are ignored) and returns them as a Scaler. The Scaler can be
+stored (save, load) and applied to other data, e.g. held-out splits or
+batches, without fitting again:
+
+In [1]: import db_hand
+In [2]: scaler = db_hand.fit_scaler('SML2010', 'MeanVar', split = 1)
+In [3]: test = db_hand.load('SML2010', split = 2, scaling = scaler)
+
+Every handler passes its scaling option to scale, which accepts the option
+strings as well as a fitted Scaler. read_all(return_scaler = True) returns
+the Scaler fitted during the load together with the data:
+
+In [4]: train, scaler = db_hand.load('SML2010', split = 1,
+   ...:                              scaling = 'MeanVar', return_scaler = True)
+"""
+import numpy as np
+
+import datatrace
+
+__methods__ = ['MinMax', 'MeanVar']
+
+
+class Scaler(object):
+    """
+    Fitted column-wise scaling x -> (x - center) / width.
+
+    Parameters
+    --------------
+    method : string 'MinMax' or 'MeanVar'
+        Scaling the parameters were fitted for.
+
+    center, width : 1D Numpy Arrays
+        Parameters per column. Constant columns use width 1, see fit.
+
+    columns : list or None
+        Names of the fitted columns, if fitted on a DataFrame.
+    """
+
+    def __init__(self, method, center, width, columns=None):
+        self.method = method
+        self.center = np.asarray(center, dtype=np.float64)
+        self.width = np.asarray(width, dtype=np.float64)
+        self.columns = None if columns is None else list(columns)
+
+    def __repr__(self):
+        return "Scaler(method={0!r}, n_columns={1})".format(
+            self.method, len(self.center))
+
+    def transform(self, values, copy=False):
+        """ Scales the columns of the 2D array values (in the order the
+        Scaler was fitted on). Float arrays are scaled in place unless copy
+        is True, other arrays are converted to float64. Returns the scaled
+        array. """
+        values = _float_array(values, copy)
+        values -= self.center
+        values /= self.width
+        return values
+
+    def inverse_transform(self, values, copy=False):
+        """ Reverts transform, see there. """
+        values = _float_array(values, copy)
+        values *= self.width
+        values += self.center
+        return values
+
+    def save(self, fn):
+        """ Stores the parameters in the .npz file fn. """
+        np.savez(fn, method=self.method, center=self.center,
+                 width=self.width,
+                 columns=np.array([] if self.columns is None else
+                                  [str(col) for col in self.columns]),
+                 named=self.columns is not None)
+
+    @classmethod
+    def load(cls, fn):
+        """ Loads a Scaler stored by save. """
+        with np.load(fn) as f:
+            columns = f['columns'].tolist() if f['named'] else None
+            return cls(str(f['method']), f['center'], f['width'], columns)
+
+
+def fit(values, method, columns=None):
+    """ Returns the Scaler of the given method ('MinMax' or 'MeanVar') fitted
+    on the given columns (names for a DataFrame, indices or slice for a 2D
+    array, all columns if None) of values (DataFrame or 2D Numpy Array).
+    Constant columns are mapped like scikit-learn does, i.e. to -1 by
+    'MinMax' (MinMaxScaler(feature_range = (-1, 1))) and to 0 by 'MeanVar'
+    (scale). """
+    if method not in __methods__:
+        raise RuntimeError("Choose scaling = 'MinMax' or 'MeanVar' to fit.")
+    names = None
+    if hasattr(values, 'columns'):
+        import pandas as pd
+        # Categorical columns are never scaled
+        names = [col for col in (values.columns if columns is None else columns)
+                 if not isinstance(values[col].dtype, pd.CategoricalDtype)]
+        values = values[names].to_numpy(dtype=np.float64)
+    elif columns is not None:
+        values = values[:, columns]
+    if method == 'MinMax':
+        low, high = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+        center, width = (high + low) / 2., (high - low) / 2.
+        center[width == 0] = low[width == 0] + 1.
+    else:
+        center, width = np.nanmean(values, axis=0), np.nanstd(values, axis=0)
+    width[width == 0] = 1.
+    return Scaler(method, center, width, names)
+
+
+def scale(data, columns, scaling, return_scaler=False):
+    """
+    Scales the given columns of data as chosen by the scaling option of
+    read_all and returns the scaled data.
+
+    Parameters
+    --------------
+    data : DataFrame or 2D Numpy Array
+        Data to be scaled. Float arrays are scaled in place.
+
+    columns : list or slice
+        Names (DataFrame) or slice (2D Numpy Array) of the columns to scale.
+        Categorical columns of a DataFrame are never scaled. Ignored if
+        scaling is a Scaler fitted on named columns.
+
+    scaling : string 'MinMax', 'MeanVar', 'None' or Scaler
+        If a string, the scaling is fitted on data. A fitted Scaler is
+        applied as it is.
+
+    return_scaler : Boolean
+        If True, the Scaler applied to data (None for scaling = 'None') is
+        returned as well, e.g. to scale other splits without fitting again.
+
+    Returns
+    -------------
+    The scaled data, of the same type as data, or the tuple (data, Scaler)
+    if return_scaler is True. Float arrays are scaled in place, read-only
+    ones (e.g. views of a DataFrame) are copied first. For a DataFrame, the
+    scaled columns are copied into one float block, which is scaled in
+    place and becomes the block of the returned DataFrame.
+    """
+    if isinstance(scaling, str) and scaling == 'None':
+        return (data, None) if return_scaler else data
+    with datatrace.stage('scale') as stage:
+        data, scaler = _scale(data, columns, scaling)
+        stage.done(data, method=scaler.method)
+    return (data, scaler) if return_scaler else data
+
+
+def _scale(data, columns, scaling):
+    """ Returns the scaled data and the applied Scaler, see scale. """
+    if isinstance(scaling, Scaler):
+        scaler = scaling
+    elif scaling not in __methods__:
+        raise RuntimeError("Choose scaling = 'MinMax', 'MeanVar', 'None' or "
+                           "a fitted datascaling.Scaler.")
+    if not hasattr(data, 'columns'):
+        if data.dtype.kind != 'f':
+            data = data.astype(np.float64)
+        elif not data.flags.writeable:
+            # E.g. DataFrame.values of a single block under copy-on-write
+            data = data.copy(order='K')
+        if not isinstance(scaling, Scaler):
+            scaler = fit(data[:, columns], scaling)
+        # Basic slicing gives a view, so data is scaled in place
+        scaler.transform(data[:, columns])
+        return data, scaler
+    import pandas as pd
+    if isinstance(scaling, Scaler) and scaling.columns is not None:
+        columns = scaling.columns
+    columns = [col for col in columns
+               if not isinstance(data[col].dtype, pd.CategoricalDtype)]
+    # One copy of the columns into a float block, which is scaled in place
+    # and wrapped (not copied) as block of the result, instead of writing
+    # the scaled values back into data
+    values = np.empty((len(data), len(columns)), dtype=np.float64, order='F')
+    for i, col in enumerate(columns):
+        values[:, i] = data[col].to_numpy(dtype=np.float64)
+    if not isinstance(scaling, Scaler):
+        scaler = fit(values, scaling)
+        scaler.columns = columns
+    scaler.transform(values)
+    result = pd.DataFrame(values, index=data.index, columns=columns,
+                          copy=False)
+    scaled = set(columns)
+    rest = [col for col in data.columns if col not in scaled]
+    if rest:
+        result = pd.concat([result, data[rest]], axis=1)
+    if result.columns.tolist() != data.columns.tolist():
+        result = result[data.columns]
+    return result, scaler
+
+
+def _float_array(values, copy):
+    values = np.asarray(values)
+    if values.dtype.kind != 'f':
+        return values.astype(np.float64)
+    return values.copy() if copy else values
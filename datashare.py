@@ -0,0 +1,250 @@
+# coding: utf8
+
+""" Sharing of read_all results between processes through memory-mapped
+files.
+
+Remarks
+----------
+If sharing is enabled (environment variable DB_HAND_SHARE=1 or enable()),
+the first process calling read_all with certain arguments publishes the
+result as .npy files in a folder named by the hash of the memo key (see
+datamemo). Later calls with the same arguments, also from other processes,
+memory-map these files read-only instead of parsing the source again, so the
+operating system keeps a single copy of the data in memory. Publishing is
+serialized by a lock file, so parallel workers wait for the first one
+instead of parsing as well.
+
+Results consisting of Numpy Arrays (also inside tuples, lists and dicts,
+e.g. the Yale faces) are shared. Other results, e.g. DataFrames, and calls
+with arguments other than strings, numbers, booleans, None and tuples of
+them are not shared.
+
+Every process using a shared result holds a reference (a file named by its
+pid in the folder refs). References are released at the exit of the process
+or by release(). The last process releasing a result removes its files.
+References of processes which are no longer alive are ignored.
+
+The files are stored in sharepath, which defaults to a folder in /dev/shm
+(or the temporary folder if /dev/shm does not exist) and can be set by the
+environment variable DB_HAND_SHARE_DIR.
+"""
+import atexit
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # No locking, parallel workers may publish the same result twice
+    fcntl = None
+
+enabled = os.environ.get('DB_HAND_SHARE', '0') == '1'
+
+sharepath = os.environ.get('DB_HAND_SHARE_DIR', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+    'db_hand_{0}'.format(os.getuid() if hasattr(os, 'getuid') else 0)))
+
+# Names of the results referenced by this process
+_references = set()
+
+
+def enable(flag=True):
+    """ Enables (or disables) sharing of read_all results in this process. """
+    global enabled
+    enabled = flag
+
+
+def shareable_key(key):
+    """ Returns the name (hash) of the memo key if the key only contains
+    strings, numbers, booleans and None, otherwise None. """
+    if not _plain(key):
+        return None
+    return hashlib.sha1(repr(key).encode('utf8')).hexdigest()[:20]
+
+
+def load(name, compute):
+    """
+    Returns the result published under name. If it does not exist, compute
+    is called and its result is published.
+
+    Parameters
+    --------------
+    name : string
+        Name of the result, see shareable_key.
+
+    compute : callable
+        Function without arguments returning the result.
+
+    Returns
+    -------------
+    The result with all arrays memory-mapped read-only, or the result of
+    compute if it cannot be shared (then it is not published).
+    """
+    folder = os.path.join(sharepath, name)
+    with _Lock(folder + '.lock'):
+        if not os.path.isfile(os.path.join(folder, 'meta.json')):
+            result = compute()
+            try:
+                meta = _describe(result)
+            except TypeError:
+                return result
+            _publish(result, meta, folder)
+        _acquire(name)
+        return _attach(folder)
+
+
+def release(name=None):
+    """ Releases the reference of this process on the result name (or on all
+    results if None). Files of results without references are removed. """
+    for name in list(_references) if name is None else [name]:
+        _references.discard(name)
+        folder = os.path.join(sharepath, name)
+        with _Lock(folder + '.lock'):
+            try:
+                os.remove(os.path.join(folder, 'refs', str(os.getpid())))
+            except OSError:
+                pass
+            if not references(name):
+                shutil.rmtree(folder, ignore_errors=True)
+
+
+def references(name):
+    """ Returns the pids of the alive processes referencing result name. """
+    try:
+        pids = [int(pid) for pid in
+                os.listdir(os.path.join(sharepath, name, 'refs'))]
+    except OSError:
+        return []
+    return [pid for pid in pids if _alive(pid)]
+
+
+def published():
+    """ Returns the names of all published results. """
+    if not os.path.isdir(sharepath):
+        return []
+    return sorted(name for name in os.listdir(sharepath)
+                  if os.path.isfile(os.path.join(sharepath, name, 'meta.json')))
+
+
+def cleanup():
+    """ Removes all published results which are not referenced by an alive
+    process, e.g. left over by killed processes. """
+    for name in published():
+        folder = os.path.join(sharepath, name)
+        with _Lock(folder + '.lock'):
+            if not references(name):
+                shutil.rmtree(folder, ignore_errors=True)
+
+
+def _acquire(name):
+    refs = os.path.join(sharepath, name, 'refs')
+    _makedirs(refs)
+    open(os.path.join(refs, str(os.getpid())), 'w').close()
+    _references.add(name)
+
+
+def _describe(result):
+    """ Returns the json description of the structure of result. Raises
+    TypeError if result cannot be shared. """
+    if isinstance(result, np.ndarray) and result.dtype.kind != 'O':
+        return {'kind': 'array'}
+    elif isinstance(result, (tuple, list)):
+        return {'kind': type(result).__name__,
+                'items': [_describe(item) for item in result]}
+    elif isinstance(result, dict) and all(isinstance(key, (int, str))
+                                          for key in result):
+        keys = sorted(result, key=repr)
+        return {'kind': 'dict', 'keys': keys,
+                'items': [_describe(result[key]) for key in keys]}
+    raise TypeError("Result of type {0} cannot be shared.".format(
+        type(result).__name__))
+
+
+def _arrays(result, meta):
+    """ Returns the arrays of result in the order of its description. """
+    if meta['kind'] == 'array':
+        return [result]
+    if meta['kind'] == 'dict':
+        result = [result[key] for key in meta['keys']]
+    return [array for item, item_meta in zip(result, meta['items'])
+            for array in _arrays(item, item_meta)]
+
+
+def _publish(result, meta, folder):
+    tmp = '{0}.tmp{1}'.format(folder, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    _makedirs(tmp)
+    for i, array in enumerate(_arrays(result, meta)):
+        np.save(os.path.join(tmp, 'a{0}.npy'.format(i)), array)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(folder, ignore_errors=True)
+    os.rename(tmp, folder)
+
+
+def _attach(folder):
+    with open(os.path.join(folder, 'meta.json')) as f:
+        meta = json.load(f)
+    counter = [0]
+
+    def build(meta):
+        if meta['kind'] == 'array':
+            counter[0] += 1
+            return np.load(os.path.join(folder, 'a{0}.npy'.format(
+                counter[0] - 1)), mmap_mode='r')
+        items = [build(item) for item in meta['items']]
+        if meta['kind'] == 'dict':
+            return dict(zip(meta['keys'], items))
+        return tuple(items) if meta['kind'] == 'tuple' else items
+    return build(meta)
+
+
+def _makedirs(folder):
+    try:
+        os.makedirs(folder)
+    except OSError:
+        # Created in parallel by another process
+        if not os.path.isdir(folder):
+            raise
+
+
+def _plain(value):
+    if isinstance(value, (tuple, list)):
+        return all(_plain(item) for item in value)
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class _Lock(object):
+    """ Exclusive lock on a file (no-op without fcntl). """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def __enter__(self):
+        if fcntl is not None:
+            _makedirs(os.path.dirname(self.fn))
+            self.f = open(self.fn, 'a')
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
+
+
+atexit.register(release)
@@ -0,0 +1,151 @@
+# coding: utf8
+
+""" Deterministic train/test and k-fold splits shared by all handlers.
+
+Remarks
+----------
+Split indices only depend on the number of samples, the seed and the number
+of folds (or the test size). They are computed once with numpy's RandomState,
+which produces the same permutation for a given seed on all platforms and
+versions, and are stored as .npy files in the folder _splits of the cache
+folder (see datacache.cachepath). Later calls, also from other processes,
+map these files read-only instead of computing the permutation again.
+
+Within the training and the test set the indices are sorted, such that
+selecting rows (e.g. X[train]) reads the data in memory order.
+
+Layout
+----------
+<cachepath>/_splits/kfold_<n_samples>_<n_folds>_<seed>.npy
+    Row i holds the sorted test indices of fold i followed by its sorted
+    training indices.
+<cachepath>/_splits/holdout_<n_samples>_<n_test>_<seed>.npy
+    Sorted test indices followed by sorted training indices.
+"""
+import os
+
+import numpy as np
+
+import datacache
+
+
+def split_xy(data):
+    """ Returns views X (all but the last column) and y (last column) of the
+    2D Numpy Array data, see read_all of the handlers. """
+    return data[:, :-1], data[:, -1]
+
+
+def kfold_indices(n_samples, n_folds=5, seed=0, cache=True):
+    """
+    Returns the (train, test) index arrays of the k folds of n_samples
+    samples shuffled with the given seed.
+
+    Parameters
+    --------------
+    n_samples : Integer
+        Number of samples.
+
+    n_folds : Integer
+        Number of folds. The first n_samples % n_folds folds have one test
+        sample more than the others.
+
+    seed : Integer
+        Seed of the permutation.
+
+    cache : Boolean
+        If True, the indices are stored in and loaded from the cache folder.
+
+    Returns
+    -------------
+    List of n_folds tuples (train, test) of sorted 1D index arrays. They are
+    read-only views of one array.
+    """
+    if not 1 < n_folds <= n_samples:
+        raise RuntimeError("Choose 1 < n_folds <= n_samples.")
+    folds = _cached('kfold_{0}_{1}_{2}.npy'.format(n_samples, n_folds, seed),
+                    lambda: _kfold(n_samples, n_folds, seed), cache)
+    sizes = np.full(n_folds, n_samples // n_folds)
+    sizes[:n_samples % n_folds] += 1
+    return [(row[n_test:], row[:n_test]) for row, n_test in zip(folds, sizes)]
+
+
+def holdout_indices(n_samples, test_size=0.25, seed=0, cache=True):
+    """
+    Returns the (train, test) index arrays of a random split of n_samples
+    samples into a training and a test set.
+
+    Parameters
+    --------------
+    n_samples : Integer
+        Number of samples.
+
+    test_size : Float or Integer
+        Fraction (if below 1) or number of samples in the test set. Fractions
+        are rounded up.
+
+    seed : Integer
+        Seed of the permutation.
+
+    cache : Boolean
+        If True, the indices are stored in and loaded from the cache folder.
+
+    Returns
+    -------------
+    Tuple (train, test) of sorted 1D index arrays. They are read-only views of
+    one array.
+    """
+    n_test = int(np.ceil(test_size * n_samples)) if test_size < 1 \
+        else int(test_size)
+    if not 0 < n_test < n_samples:
+        raise RuntimeError("Choose test_size such that both sets are not "
+                           "empty.")
+    split = _cached('holdout_{0}_{1}_{2}.npy'.format(n_samples, n_test, seed),
+                    lambda: _holdout(n_samples, n_test, seed), cache)
+    return split[n_test:], split[:n_test]
+
+
+def _kfold(n_samples, n_folds, seed):
+    permutation = np.random.RandomState(seed).permutation(n_samples)
+    folds = np.empty((n_folds, n_samples), dtype=np.int64)
+    bounds = np.cumsum([0] + [len(test) for test in
+                              np.array_split(permutation, n_folds)])
+    for i in range(n_folds):
+        start, stop = bounds[i], bounds[i + 1]
+        folds[i, :stop - start] = np.sort(permutation[start:stop])
+        folds[i, stop - start:] = np.sort(np.concatenate(
+            [permutation[:start], permutation[stop:]]))
+    return folds
+
+
+def _holdout(n_samples, n_test, seed):
+    permutation = np.random.RandomState(seed).permutation(n_samples)
+    return np.concatenate([np.sort(permutation[:n_test]),
+                           np.sort(permutation[n_test:])])
+
+
+def _cached(name, compute, cache):
+    """ Returns the array stored under name in the splits folder, computing
+    and storing it first if needed. """
+    if not cache:
+        values = compute()
+        values.flags.writeable = False
+        return values
+    fn = os.path.join(datacache.cachepath, '_splits', name)
+    try:
+        return np.load(fn, mmap_mode='r')
+    except (IOError, OSError, ValueError):
+        pass
+    values = compute()
+    try:
+        if not os.path.isdir(os.path.dirname(fn)):
+            os.makedirs(os.path.dirname(fn))
+        # Written under a temporary name, parallel jobs never see partial files
+        tmp = '{0}.tmp{1}'.format(fn, os.getpid())
+        with open(tmp, 'wb') as f:
+            np.save(f, values)
+        os.rename(tmp, fn)
+    except (IOError, OSError):
+        # Read-only or full disk, indices are still returned
+        pass
+    values.flags.writeable = False
+    return values
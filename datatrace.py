@@ -0,0 +1,250 @@
+# coding: utf8
+
+""" Opt-in per-stage timing and allocation tracing of read_all.
+
+Remarks
+----------
+read_all of all handlers and the shared modules report their stages, e.g.
+'read_all' (the whole call, see datamemo), 'parse' and 'load' (source or
+binary cache, see datacache), 'filter' and 'reorder' (cleaning of the
+parsed data), 'scale' (see datascaling) and 'convert' (conversion of the
+DataFrame to the returned array). Stages can be nested, e.g. 'reorder' runs
+inside 'parse'.
+
+Tracing is disabled by default, then stage() returns a shared no-op context
+manager and the overhead is one function call per stage. It is enabled
+within tracing(), or for the whole process by the environment variable
+DB_HAND_TRACE naming a JSON lines file the events are appended to.
+
+Every finished stage produces one event, a dict with the keys
+
+    handler     Name of the handler module, e.g. 'handler_UCI_Concrete'.
+    stage       Name of the stage.
+    parent      Name of the enclosing stage or None.
+    start       Start time (seconds since the epoch).
+    seconds     Wall time of the stage.
+    rows        Number of rows of the result of the stage (or None).
+    bytes       Size of the arrays of the result of the stage (or None).
+    allocated   Peak of memory allocated during the stage in bytes, as
+                measured by tracemalloc. Only if tracing(memory = True).
+
+and stage specific information, e.g. memo ('hit', 'miss', 'off' or
+'uncacheable') for 'read_all'. Events are passed to all registered hooks
+(see add_hook) in the thread that ran the stage.
+
+Example
+----------
+In [1]: import datatrace, handler_UCI_Concrete
+In [2]: with datatrace.tracing() as events:
+   ...:     handler_UCI_Concrete.read_all(scaling = 'MeanVar')
+In [3]: [(e['stage'], e['seconds']) for e in events]
+Out[3]: [('load', 0.0012), ('scale', 0.0008), ('convert', 1e-05), ...]
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+# Callables receiving every event, see add_hook
+_hooks = []
+_lock = threading.Lock()
+# Number of active tracing() blocks (and DB_HAND_TRACE), tracing is enabled
+# while it is positive, and of those measuring memory
+_active = 0
+_memory = 0
+# Open stages of the current thread, innermost last
+_local = threading.local()
+
+
+def add_hook(hook):
+    """ Registers the callable hook, which is called with every event. Stages
+    are only traced while tracing is enabled, see tracing(). """
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """ Unregisters the callable hook, see add_hook. """
+    with _lock:
+        _hooks.remove(hook)
+
+
+@contextlib.contextmanager
+def tracing(hook=None, jsonl=None, memory=False):
+    """
+    Enables tracing within the with block and yields the list of all events
+    of the block.
+
+    Parameters
+    --------------
+    hook : callable or None
+        Called with every event, see add_hook.
+
+    jsonl : string or None
+        Filename of a JSON lines file every event is appended to.
+
+    memory : Boolean
+        If True, the peak memory allocated during every stage is measured
+        with tracemalloc (which slows down allocations considerably).
+    """
+    global _active, _memory
+    events = []
+    hooks = [events.append] + ([hook] if hook is not None else [])
+    stream = open(jsonl, 'a') if jsonl is not None else None
+    if stream is not None:
+        hooks.append(_writer(stream))
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    with _lock:
+        _hooks.extend(hooks)
+        _active += 1
+        _memory += int(memory)
+    try:
+        yield events
+    finally:
+        with _lock:
+            for item in hooks:
+                _hooks.remove(item)
+            _active -= 1
+            _memory -= int(memory)
+        if started:
+            tracemalloc.stop()
+        if stream is not None:
+            stream.close()
+
+
+def stage(name, handler=None):
+    """
+    Returns the context manager timing the stage name. The result of the
+    stage can be passed to its done method, which records its rows and bytes
+    and returns it, e.g.
+
+        with datatrace.stage('convert') as stage:
+            values = stage.done(data.values)
+
+    Parameters
+    --------------
+    name : string
+        Name of the stage.
+
+    handler : string or None
+        Name of the handler module. If None, the handler of the enclosing
+        stage is used.
+    """
+    if not _active:
+        return _NULL
+    return _Stage(name, handler)
+
+
+def enabled():
+    """ Returns True if stages are currently traced. """
+    return _active > 0
+
+
+class _Stage(object):
+
+    def __init__(self, name, handler):
+        self.event = {'handler': handler, 'stage': name, 'parent': None,
+                      'rows': None, 'bytes': None}
+        self.memory = _memory > 0 and tracemalloc.is_tracing()
+
+    def __enter__(self):
+        stack = _stack()
+        if stack:
+            parent = stack[-1].event
+            self.event['parent'] = parent['stage']
+            if self.event['handler'] is None:
+                self.event['handler'] = parent['handler']
+        if self.memory:
+            # The peak is reset per stage, open stages keep their maximum
+            current, peak = tracemalloc.get_traced_memory()
+            for item in stack:
+                if item.memory:
+                    item.peak = max(item.peak, peak)
+            tracemalloc.reset_peak()
+            self.base, self.peak = current, current
+        stack.append(self)
+        self.event['start'] = time.time()
+        self.clock = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.event['seconds'] = time.perf_counter() - self.clock
+        stack = _stack()
+        stack.remove(self)
+        if self.memory:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            for item in stack:
+                if item.memory:
+                    item.peak = max(item.peak, peak)
+            self.event['allocated'] = peak - self.base
+        with _lock:
+            hooks = list(_hooks)
+        for hook in hooks:
+            hook(self.event)
+
+    def done(self, result, **info):
+        """ Records the rows and bytes of result and the given information
+        in the event and returns result. """
+        self.event['rows'], self.event['bytes'] = _size(result)
+        self.event.update(info)
+        return result
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def done(self, result, **info):
+        return result
+
+
+_NULL = _NullStage()
+
+
+def _stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+def _size(result):
+    """ Returns the number of rows and the bytes of the arrays of result. """
+    if isinstance(result, tuple):
+        # E.g. Yale layout = 'tensor', rows of the labels (last item)
+        sizes = [_size(item) for item in result]
+        return sizes[-1][0], sum(size or 0 for _, size in sizes)
+    elif isinstance(result, dict):
+        # E.g. Yale layout = 'dict', rows depend on datashape
+        return None, sum(_size(item)[1] or 0 for item in result.values())
+    elif hasattr(result, 'memory_usage'):
+        return len(result), int(result.memory_usage(index=True).sum())
+    elif hasattr(result, 'indptr'):
+        return result.shape[0], (result.data.nbytes + result.indices.nbytes +
+                                 result.indptr.nbytes)
+    elif hasattr(result, 'nbytes') and hasattr(result, 'shape'):
+        return (result.shape[0] if result.ndim else None), result.nbytes
+    return None, None
+
+
+def _writer(stream):
+    def write(event):
+        line = json.dumps(event, default=str) + '\n'
+        with _lock:
+            stream.write(line)
+            stream.flush()
+    return write
+
+
+if os.environ.get('DB_HAND_TRACE'):
+    _hooks.append(_writer(open(os.environ['DB_HAND_TRACE'], 'a')))
+    _active = 1
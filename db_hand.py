@@ -0,0 +1,598 @@
+# coding: utf8
+
+""" Central registry of all data sets handled by the handler_*.py files.
+
+Remarks
+----------
+Handlers are found by their filename and are only imported on first use, so
+importing this module does not import pandas, sklearn or skimage. A data set
+is addressed by the handler name without the 'handler_' prefix, e.g.
+'UCI_Concrete'. Names are case-insensitive and the 'UCI_' prefix can be left
+out, e.g. 'concrete'.
+
+Example
+----------
+In [1]: import db_hand
+In [2]: data = db_hand.load('Concrete', scaling = 'MeanVar')
+In [3]: db_hand.names()
+Out[3]: ['AmesHousing', 'AutoMPG', 'CaliforniaHousing', ...]
+
+Command line
+----------
+python -m db_hand build [name ...] [--out DIR] [--jobs N]
+    Parses all data sets once into binary artifacts, see build.
+"""
+import importlib
+import os
+
+# Get basepath such that only relatives paths matter from this folder on
+basepath = os.path.dirname(os.path.realpath(__file__))
+
+# Number of threads of the default executor of aload
+max_workers = int(os.environ.get('DB_HAND_WORKERS', 4))
+
+# Running loads of aload per (name, options, executor), see aload
+_pending = {}
+_executor = []
+
+# Data sets which are not a single (X, y) matrix, see load_suite
+__image_sets__ = ['CroppedYaleFacesB']
+
+# Data sets not shipped with their handler but loaded from another package,
+# which may not provide them (load_boston was removed in scikit-learn 1.2),
+# see load_suite
+__external_sets__ = ['UCI_Boston']
+
+# Relative parse cost per byte of the source files by extension (others 1),
+# used to start expensive data sets first, see load_suite
+__parse_cost__ = {'.xlsx': 50, '.xls': 10}
+
+
+def names():
+    """ Returns the sorted names of all available data sets. """
+    return sorted(fn[len('handler_'):-len('.py')] for fn in os.listdir(basepath)
+                  if fn.startswith('handler_') and fn.endswith('.py'))
+
+
+def get_handler(name):
+    """ Imports and returns the handler module of the data set with the given
+    name. Repeated calls return the already imported module.
+
+    Parameters
+    --------------
+    name : string
+        Name of the data set, see names().
+
+    Returns
+    -------------
+    The handler module, e.g. handler_UCI_Concrete for name = 'Concrete'.
+    """
+    return importlib.import_module('handler_' + resolve(name))
+
+
+def resolve(name):
+    """ Returns the canonical name (see names()) of the given data set name.
+    Raises a RuntimeError if the name is unknown. """
+    key = _normalize(name)
+    for candidate in names():
+        if _normalize(candidate) == key:
+            return candidate
+    raise RuntimeError("Unknown data set '{0}'. Choose one of {1}.".format(
+        name, ", ".join(names())))
+
+
+def load(name, **opts):
+    """ Loads the data set with the given name by calling read_all of its
+    handler.
+
+    Parameters
+    --------------
+    name : string
+        Name of the data set, see names().
+
+    opts : keyword arguments
+        Passed to read_all of the handler, e.g. scaling = 'MinMax'.
+
+    Returns
+    -------------
+    The return value of read_all of the handler.
+    """
+    return get_handler(name).read_all(**opts)
+
+
+async def aload(name, executor=None, **opts):
+    """ Loads the data set with the given name like load, but in an executor
+    such that the running asyncio event loop is not blocked.
+
+    Parameters
+    --------------
+    name : string
+        Name of the data set, see names().
+
+    executor : concurrent.futures.Executor or None
+        Executor running load. If None, a shared thread pool of max_workers
+        threads is used. A ProcessPoolExecutor parses in parallel also for
+        sources parsed in pure python (e.g. .xlsx), but results are then
+        pickled back and not memoized in this process (see datamemo).
+
+    opts : keyword arguments
+        Passed to read_all of the handler, e.g. scaling = 'MinMax'.
+
+    Returns
+    -------------
+    The return value of read_all of the handler. Concurrent calls with the
+    same name and options (and executor) share one call of load and get the
+    same result object. Options which are not plain values, e.g. a fitted
+    datascaling.Scaler, are only shared if they are the same object.
+    """
+    import asyncio
+    import functools
+    loop = asyncio.get_running_loop()
+    key = (resolve(name), tuple((option, _option_key(value)) for option, value
+                                in sorted(opts.items())), id(executor))
+    future = _pending.get(key)
+    if future is None or future.get_loop() is not loop:
+        future = loop.run_in_executor(executor or _default_executor(),
+                                      functools.partial(load, name, **opts))
+        _pending[key] = future
+
+        def finished(done):
+            if _pending.get(key) is done:
+                del _pending[key]
+        future.add_done_callback(finished)
+    # Cancelling one caller does not cancel the load of the others
+    return await asyncio.shield(future)
+
+
+async def aload_many(requests, executor=None, **opts):
+    """ Loads several data sets concurrently (see aload) and yields them as
+    they complete.
+
+    Parameters
+    --------------
+    requests : list
+        Names of data sets or tuples (name, dict of options of read_all).
+
+    executor : concurrent.futures.Executor or None
+        Executor running load, see aload.
+
+    opts : keyword arguments
+        Options passed to read_all of all handlers, updated by the options of
+        the single requests.
+
+    Returns
+    -------------
+    Asynchronous iterator of tuples (request, data) in the order of
+    completion, where request is the item of requests. If a load fails, its
+    exception is raised and the remaining loads are cancelled.
+
+    Example
+    -------------
+    In [3]: async for request, data in db_hand.aload_many(
+       ...:         ['Concrete', ('WineQuality', {'wine_color' : 'white'})],
+       ...:         scaling = 'MeanVar'):
+       ...:     print(request, data.shape)
+    """
+    import asyncio
+
+    async def tagged(request):
+        name, options = (request, {}) if isinstance(request, str) else request
+        return request, await aload(name, executor, **dict(opts, **options))
+
+    tasks = [asyncio.ensure_future(tagged(request)) for request in requests]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def fit_scaler(name, scaling, **opts):
+    """ Fits the given scaling on the features (all but the last column) of
+    the data set with the given name and returns the fitted
+    datascaling.Scaler. It can be passed as scaling to load, e.g. to scale
+    another split with the same parameters. To get the scaled data as well,
+    load with return_scaler = True instead, which returns both at once.
+
+    Parameters
+    --------------
+    name : string
+        Name of the data set, see names().
+
+    scaling : string 'MinMax' or 'MeanVar'
+        Scaling to fit, see read_all of the handlers.
+
+    opts : keyword arguments
+        Passed to read_all of the handler, e.g. split = 1.
+
+    Returns
+    -------------
+    The fitted datascaling.Scaler.
+    """
+    import datascaling
+    if scaling not in datascaling.__methods__:
+        raise RuntimeError("Choose scaling = 'MinMax' or 'MeanVar' to fit.")
+    return load(name, return_type='pd', scaling=scaling, return_scaler=True,
+                **opts)[1]
+
+
+def kfold(name, n_folds=5, seed=0, **opts):
+    """ Loads the data set with the given name and returns its k-fold splits.
+
+    Parameters
+    --------------
+    name : string
+        Name of the data set, see names().
+
+    n_folds, seed : Integer
+        Number of folds and seed of the permutation, see
+        datasplit.kfold_indices.
+
+    opts : keyword arguments
+        Passed to read_all of the handler, return_type must stay 'np'.
+
+    Returns
+    -------------
+    Tuple (X, y, folds). X and y are views of the features and of the last
+    column of the loaded data, folds is a list of (train, test) index arrays,
+    e.g. X[train], y[train] for the training set of a fold.
+    """
+    import datasplit
+    X, y = datasplit.split_xy(load(name, **opts))
+    return X, y, datasplit.kfold_indices(len(y), n_folds, seed)
+
+
+def holdout(name, test_size=0.25, seed=0, **opts):
+    """ Loads the data set with the given name and returns a random split into
+    training and test set.
+
+    Parameters
+    --------------
+    name : string
+        Name of the data set, see names().
+
+    test_size : Float or Integer
+        Fraction or number of test samples, see datasplit.holdout_indices.
+
+    seed : Integer
+        Seed of the permutation.
+
+    opts : keyword arguments
+        Passed to read_all of the handler, return_type must stay 'np'.
+
+    Returns
+    -------------
+    Tuple (X, y, train, test). X and y are views of the features and of the
+    last column of the loaded data, train and test are index arrays.
+    """
+    import datasplit
+    X, y = datasplit.split_xy(load(name, **opts))
+    return (X, y) + datasplit.holdout_indices(len(y), test_size, seed)
+
+
+def load_suite(datasets=None, scaling='None', processes=None, **opts):
+    """ Loads several data sets in parallel in a process pool and splits
+    them into features and target.
+
+    Parameters
+    --------------
+    datasets : list of strings or None
+        Names of the data sets, see names(). If None, all tabular data sets
+        with bundled data (all but __image_sets__ and __external_sets__,
+        i.e. CroppedYaleFacesB and UCI_Boston) are loaded.
+
+    scaling : string 'MinMax', 'MeanVar' or 'None'
+        Scaling passed to read_all of all handlers.
+
+    processes : Integer or None
+        Number of worker processes. If None, the number of CPUs (at most the
+        number of data sets). If 1, the data sets are loaded in this process.
+
+    opts : keyword arguments
+        Passed to read_all of all handlers, return_type must stay 'np'.
+
+    Returns
+    -------------
+    Tuple (data, times) of dicts with the canonical names as keys. data holds
+    the tuples (X, y) of the features and the last column of the data sets,
+    times the load time of every data set in seconds (measured in the
+    worker).
+
+    Remarks
+    -------------
+    Data sets are started in the order of their estimated parse cost, i.e.
+    the size of their source files weighted by __parse_cost__ (Excel files
+    first), so the total time is bounded by the slowest data set rather than
+    by the sum. A failing data set raises a RuntimeError naming it.
+    """
+    if datasets is None:
+        datasets = [name for name in names() if name not in __image_sets__ and
+                    name not in __external_sets__]
+    datasets = [resolve(name) for name in datasets]
+    opts = dict(opts, scaling=scaling)
+    tasks = sorted(((name, opts) for name in datasets),
+                   key=lambda task: -_parse_cost(task[0]))
+    if processes is None:
+        processes = min(len(tasks), os.cpu_count() or 1)
+    data, times = {}, {}
+    if processes <= 1:
+        results = map(_load_xy, tasks)
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(_load_xy, tasks, chunksize=1)
+    try:
+        for name, X, y, seconds in results:
+            data[name], times[name] = (X, y), seconds
+    finally:
+        if processes > 1:
+            pool.terminate()
+    return dict((name, data[name]) for name in datasets), \
+        dict((name, times[name]) for name in datasets)
+
+
+def build(out=None, jobs=1, datasets=None):
+    """ Parses and cleans the data sets once and stores them as binary
+    artifacts (memory-mappable .npy files, see datacache) with a manifest.
+    read_all then loads the artifacts instead of the sources, see datacache.
+
+    Parameters
+    --------------
+    out : string or None
+        Output folder. If None, datacache.artifactpath is used, which is
+        also where read_all looks for artifacts.
+
+    jobs : Integer
+        Number of worker processes, data sets with the highest parse cost
+        are started first (see load_suite).
+
+    datasets : list of strings or None
+        Names of the data sets, see names(). If None, all data sets with
+        parsed sources (all handlers with __cache_version__) are built.
+
+    Returns
+    -------------
+    The manifest, a dict with the keys format, built (time), environment
+    (package versions), entries and failed. Every entry describes one
+    artifact: dataset, handler, options of parsing, version
+    (__cache_version__), key (hash of version and options), sources (SHA1 of
+    every source file) and path (relative to out). Entries of data sets not
+    built in this call are kept from an existing manifest.
+
+    Remarks
+    -------------
+    Every call of the __build__ list of a handler is run, by default
+    read_all with default options. Artifacts are only used for the options
+    they were built with, other options still parse the sources.
+
+    Artifacts listed in an existing manifest which are not built again are
+    removed, nothing else in out is touched. Raises a RuntimeError if out
+    is a non-empty folder without a manifest (i.e. not created by build).
+    """
+    import json
+    import time
+    import datacache
+    out = os.path.realpath(out or datacache.artifactpath)
+    tasks = []
+    for name in names() if datasets is None else datasets:
+        handler = get_handler(name)
+        if not hasattr(handler, '__cache_version__'):
+            # No parsed sources, e.g. UCI_Boston and CroppedYaleFacesB
+            continue
+        for function, options in getattr(handler, '__build__',
+                                         [('read_all', {})]):
+            tasks.append((resolve(name), function, options, out))
+    tasks.sort(key=lambda task: -_parse_cost(task[0]))
+
+    fn = os.path.join(out, 'manifest.json')
+    entries, failed = {}, []
+    try:
+        with open(fn) as f:
+            manifest = json.load(f)
+        entries = dict(((entry['handler'], entry['key']), entry)
+                       for entry in manifest['entries'])
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        if os.path.isdir(out) and os.listdir(out):
+            # Never writes into (and prunes) folders not created by build
+            raise RuntimeError("Folder {0} is not empty and has no valid "
+                               "manifest.json. Choose an empty or new "
+                               "folder.".format(out))
+    # Artifacts of the previous manifest are pruned unless built again
+    previous = [entry['path'] for entry in entries.values()]
+    if entries and manifest.get('format') != datacache.__manifest_format__:
+        entries = {}
+    if jobs > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap_unordered(_build_task, tasks, chunksize=1)
+    else:
+        results = map(_build_task, tasks)
+    try:
+        for name, function, options, seconds, recorded, error in results:
+            print("{0:>32s} {1}({2}): {3}".format(
+                name, function, ", ".join("{0}={1}".format(key, value)
+                                          for key, value in options.items()),
+                error or "{0:.2f} s".format(seconds)))
+            if error is not None:
+                failed.append({'dataset': name, 'function': function,
+                               'options': options, 'error': error})
+            for entry in recorded:
+                entry['dataset'] = name
+                entry['bytes'] = sum(
+                    os.path.getsize(os.path.join(out, entry['path'], item))
+                    for item in os.listdir(os.path.join(out, entry['path'])))
+                entries[entry['handler'], entry['key']] = entry
+    finally:
+        if jobs > 1:
+            pool.terminate()
+
+    import numpy
+    import pandas
+    import platform
+    manifest = {'format': datacache.__manifest_format__,
+                'built': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'environment': {'python': platform.python_version(),
+                                'numpy': numpy.__version__,
+                                'pandas': pandas.__version__},
+                'entries': sorted(entries.values(),
+                                  key=lambda entry: entry['path']),
+                'failed': failed}
+    _prune(out, previous, [entry['path'] for entry in manifest['entries']])
+    # Written under a temporary name, readers never see partial manifests
+    tmp = '{0}.tmp{1}'.format(fn, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(tmp, fn)
+    return manifest
+
+
+def main(argv=None):
+    """ Command line interface, see python -m db_hand --help. """
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m db_hand',
+        description="Tools for the data sets of the handler_*.py files.")
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser(
+        'build', help="Parse all data sets once into binary artifacts "
+        "(see db_hand.build).")
+    command.add_argument('datasets', nargs='*',
+                         help="data sets to build, default all")
+    command.add_argument('--out', help="output folder, default "
+                         "datacache.artifactpath")
+    command.add_argument('--jobs', type=int, default=1,
+                         help="number of worker processes")
+    args = parser.parse_args(argv)
+    if args.command != 'build':
+        parser.print_help()
+        return 2
+    manifest = build(args.out, args.jobs, args.datasets or None)
+    print("{0} artifacts, {1} failed".format(len(manifest['entries']),
+                                             len(manifest['failed'])))
+    return 1 if manifest['failed'] else 0
+
+
+def invalidate(name=None):
+    """ Removes the cached parsed data (see datacache) and the memoized results
+    (see datamemo) of the data set with the given name, or of all data sets if
+    name is None. """
+    import datacache
+    import datamemo
+    handler = None if name is None else 'handler_' + resolve(name)
+    datacache.invalidate(handler)
+    datamemo.clear(handler)
+
+
+def rebuild(name, **opts):
+    """ Removes the cached parsed data of the data set with the given name and
+    loads it again, see load. """
+    invalidate(name)
+    return load(name, **opts)
+
+
+def _load_xy(task):
+    """ Loads the data set of task = (name, opts) and returns (name, X, y,
+    seconds), see load_suite. """
+    import time
+    import datasplit
+    name, opts = task
+    start = time.time()
+    try:
+        X, y = datasplit.split_xy(load(name, **opts))
+    except Exception as e:
+        raise RuntimeError("Loading {0} failed: {1}: {2}".format(
+            name, type(e).__name__, e))
+    return name, X, y, time.time() - start
+
+
+def _build_task(task):
+    """ Runs one call of build in the output folder and returns (name,
+    function, options, seconds, recorded entries, error or None). """
+    import time
+    import datacache
+    name, function, options, out = task
+    paths = datacache.cachepath, datacache.artifactpath
+    # Write into out and never read existing artifacts
+    datacache.cachepath, datacache.artifactpath = out, None
+    datacache.recorded(reset=True)
+    start = time.time()
+    try:
+        func = getattr(get_handler(name), function)
+        # Memoized functions (see datamemo) must reach the cache
+        kwargs = dict(options, memo=False) if hasattr(func, 'folders') \
+            else options
+        func(cache=True, **kwargs)
+    except Exception as e:
+        return name, function, options, time.time() - start, [], \
+            '{0}: {1}'.format(type(e).__name__, e)
+    finally:
+        datacache.cachepath, datacache.artifactpath = paths
+    return name, function, options, time.time() - start, \
+        datacache.recorded(reset=True), None
+
+
+def _prune(out, previous, paths):
+    """ Removes the entry folders <handler>/<key>/<sources> in out listed in
+    the previous manifest (previous) which are not in paths. Nothing else in
+    out is touched. """
+    import shutil
+    keep = set(os.path.normpath(path) for path in paths)
+    for path in set(os.path.normpath(path) for path in previous) - keep:
+        parts = path.split(os.sep)
+        if len(parts) != 3 or not parts[0].startswith('handler_') or \
+                '..' in parts:
+            continue
+        shutil.rmtree(os.path.join(out, path), ignore_errors=True)
+        parent = os.path.join(out, parts[0], parts[1])
+        if os.path.isdir(parent) and not os.listdir(parent):
+            os.rmdir(parent)
+
+
+def _option_key(value):
+    """ Returns the key of the option value in _pending. Plain values (and
+    tuples and lists of them) are compared by value, all other objects (e.g.
+    a datascaling.Scaler, whose repr omits its parameters) by identity. """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return (type(value).__name__, value)
+    if isinstance(value, (tuple, list)):
+        return (type(value).__name__,
+                tuple(_option_key(item) for item in value))
+    return ('id', id(value))
+
+
+def _parse_cost(name):
+    """ Returns the size of the source files of the data set weighted by
+    __parse_cost__. """
+    cost = 0
+    for folder in get_handler(name).read_all.folders():
+        for fn in os.listdir(folder) if os.path.isdir(folder) else []:
+            if fn.startswith('_') or fn.startswith('.'):
+                continue
+            path = os.path.join(folder, fn)
+            if os.path.isfile(path):
+                cost += os.path.getsize(path) * __parse_cost__.get(
+                    os.path.splitext(fn)[1].lower(), 1)
+    return cost
+
+
+def _default_executor():
+    if not _executor:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor.append(ThreadPoolExecutor(max_workers,
+                                            thread_name_prefix='db_hand'))
+    return _executor[0]
+
+
+def _normalize(name):
+    name = name.lower()
+    if name.startswith('handler_'):
+        name = name[len('handler_'):]
+    if name.startswith('uci_'):
+        name = name[len('uci_'):]
+    return name
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -44,12 +44,23 @@ References
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 2
+
+# Calls (function, options) run by db_hand.build, see datacache
+__build__ = [('read_all', {'feature_subset' : subset})
+             for subset in ['all', 'numerical', 'intuitive']]
+
 # All Numerical Features (includes categorical numerical features)
 __idx_numerical_features__ = [
     'MSSubClass',
@@ -133,10 +144,68 @@ __idx_intuitive_features__ = [
 ]
 
 
+# Quality scale shared by several ordinal features (NA means e.g. no basement)
+__quality_levels__ = ['Po', 'Fa', 'TA', 'Gd', 'Ex']
+
+# Ordinal features stored as strings with their levels (worst to best)
+__ordinal_features__ = {
+    'LotShape' : ['IR3', 'IR2', 'IR1', 'Reg'],
+    'Utilities' : ['ELO', 'NoSeWa', 'NoSewr', 'AllPub'],
+    'LandSlope' : ['Sev', 'Mod', 'Gtl'],
+    'ExterQual' : __quality_levels__,
+    'ExterCond' : __quality_levels__,
+    'BsmtQual' : __quality_levels__,
+    'BsmtCond' : __quality_levels__,
+    'BsmtExposure' : ['No', 'Mn', 'Av', 'Gd'],
+    'BsmtFinType1' : ['Unf', 'LwQ', 'Rec', 'BLQ', 'ALQ', 'GLQ'],
+    'BsmtFinType2' : ['Unf', 'LwQ', 'Rec', 'BLQ', 'ALQ', 'GLQ'],
+    'HeatingQC' : __quality_levels__,
+    'Electrical' : ['Mix', 'FuseP', 'FuseF', 'FuseA', 'SBrkr'],
+    'KitchenQual' : __quality_levels__,
+    'Functional' : ['Sal', 'Sev', 'Maj2', 'Maj1', 'Mod', 'Min2', 'Min1', 'Typ'],
+    'FireplaceQu' : __quality_levels__,
+    'GarageFinish' : ['Unf', 'RFn', 'Fin'],
+    'GarageQual' : __quality_levels__,
+    'GarageCond' : __quality_levels__,
+    'PavedDrive' : ['N', 'P', 'Y'],
+    'PoolQC' : __quality_levels__,
+    'Fence' : ['MnWw', 'GdWo', 'MnPrv', 'GdPrv']
+}
+
+# Nominal features, levels are taken from the data
+__nominal_features__ = [
+    'MSSubClass', # Numerical codes of the type of house
+    'MSZoning',
+    'Street',
+    'Alley',
+    'LandContour',
+    'LotConfig',
+    'Neighborhood',
+    'Condition1',
+    'Condition2',
+    'BldgType',
+    'HouseStyle',
+    'RoofStyle',
+    'RoofMatl',
+    'Exterior1st',
+    'Exterior2nd',
+    'MasVnrType',
+    'Foundation',
+    'Heating',
+    'CentralAir',
+    'GarageType',
+    'MiscFeature',
+    'SaleType',
+    'SaleCondition'
+]
+
+
+@datamemo.memoized(lambda: [basepath + '/Ames_Housing'])
 def read_all(return_type = 'np', scaling = 'None',
              remove_GrLivArea_outliers = True,
              normal_sales_only = True,
-             feature_subset = 'all'):
+             feature_subset = 'all', encoding = 'codes', cache = True,
+             return_scaler = False):
     """
     Reads the complete excel sheet and returns it as a 2D Numpy Array.
     The alleged Y variable (according to the description) is stored in
@@ -144,11 +213,16 @@ def read_all(return_type = 'np', scaling = 'None',
 
     Parameters
     --------------
-    return_type : string ('np')
-        Datatype of return object. If 'np', data is returned as a 2D numpy array.
+    return_type : string ('np' or 'pd')
+        Datatype of return object. If 'np', data is returned as a 2D numpy array
+        (or scipy.sparse matrix, see encoding). If 'pd', data is returned as a
+        2D DataFrame, in which the categorical features of feature_subset 'all'
+        are pandas Categoricals.
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again. Categorical
+        features are not scaled.
 
     remove_GrLivArea_outliers : Boolean,
         If True, all samples with gross living area > 4000 sqft are removed since
@@ -156,7 +230,33 @@ def read_all(return_type = 'np', scaling = 'None',
 
     feature_subset : string 'all' (default), 'numerical', 'intuitive'
         String that decides on which features should actually be considered.
+        For 'all', numerical features are stored as float32 and the ordinal
+        and nominal features are encoded as given by encoding.
+
+    encoding : string 'codes' or 'onehot'
+        Encoding of the categorical features for return_type 'np' and
+        feature_subset 'all'. If 'codes', each categorical feature is one
+        column holding the index of its level in the vocabulary (levels of
+        ordinal features are ordered from worst to best, -1 marks missing
+        values) and a dense float32 array is returned. If 'onehot', each level
+        is one column and a scipy.sparse CSR matrix (float32) is returned.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once. The
+        vocabularies of the categorical features are stored along with it.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
 
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
@@ -164,24 +264,108 @@ def read_all(return_type = 'np', scaling = 'None',
     'np', return object is a 2D Numpy Array storing the Y-variable in the last
     column.
     """
+    data = datacache.cached_frame(
+        __name__, [basepath + '/Ames_Housing/train.csv'],
+        lambda: _read_source(remove_GrLivArea_outliers, normal_sales_only,
+                             feature_subset),
+        version = __cache_version__,
+        options = {'remove_GrLivArea_outliers' : remove_GrLivArea_outliers,
+                   'normal_sales_only' : normal_sales_only,
+                   'feature_subset' : feature_subset},
+        cache = cache)
+    # Scaled on the DataFrame, which knows the categorical features
+    data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                     return_scaler = True)
+    if return_type == 'np':
+        with datatrace.stage('convert') as stage:
+            if feature_subset != 'all':
+                data = data.values
+            elif encoding == 'codes':
+                data = _encode_codes(data)
+            elif encoding == 'onehot':
+                data = _encode_onehot(data)
+            else:
+                raise RuntimeError("Choose encoding = 'codes' or 'onehot'.")
+            data = stage.done(data)
+    elif return_type != 'pd':
+        raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source(remove_GrLivArea_outliers, normal_sales_only, feature_subset):
+    """ Reads and cleans the source file, see read_all. """
     data = pd.read_csv(basepath + '/Ames_Housing/train.csv')
+    if feature_subset == 'all':
+        data = _categorize(data)
     # Postprocessing
-    if remove_GrLivArea_outliers:
-        # See remark in the top
-        data = data[data['GrLivArea'] < 4000]
-    if normal_sales_only:
-        data = data[data['SaleCondition'] == 'Normal']
-    if feature_subset == 'numerical':
-        data = data[__idx_numerical_features__]
-    elif feature_subset == 'intuitive':
-        data = data[__idx_intuitive_features__]
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
-    if return_type == 'np':
-        return data.values
-    else:
-        raise RuntimeError("Choose return_type = 'np' to read data.")
+    with datatrace.stage('filter') as stage:
+        if remove_GrLivArea_outliers:
+            # See remark in the top
+            data = data[data['GrLivArea'] < 4000]
+        if normal_sales_only:
+            data = data[data['SaleCondition'] == 'Normal']
+        data = stage.done(data)
+    with datatrace.stage('reorder') as stage:
+        if feature_subset == 'numerical':
+            data = data[__idx_numerical_features__]
+        elif feature_subset == 'intuitive':
+            data = data[__idx_intuitive_features__]
+        return stage.done(data)
+
+
+def _categorize(data):
+    """ Converts the ordinal and nominal features to pandas Categoricals
+    (int8 codes) and all other features to float32. The vocabularies of the
+    nominal features are taken from all samples before any filtering, so they
+    do not depend on the options of read_all. """
+    columns = {}
+    for col in data.columns:
+        if col in __ordinal_features__:
+            columns[col] = pd.Categorical(data[col],
+                categories = __ordinal_features__[col], ordered = True)
+        elif col in __nominal_features__:
+            columns[col] = pd.Categorical(data[col])
+        else:
+            columns[col] = data[col].to_numpy(dtype = np.float32)
+    return pd.DataFrame(columns, index = data.index)
+
+
+def _encode_codes(data):
+    """ Returns the dense float32 array of the data with categorical features
+    replaced by their codes. """
+    values = np.empty(data.shape, dtype = np.float32)
+    for i, col in enumerate(data.columns):
+        if isinstance(data[col].dtype, pd.CategoricalDtype):
+            values[:, i] = data[col].cat.codes.to_numpy()
+        else:
+            values[:, i] = data[col].to_numpy()
+    return values
+
+
+def _encode_onehot(data):
+    """ Returns the scipy.sparse CSR matrix (float32) of the data with one
+    column per level of each categorical feature, in the order of the
+    vocabulary. Missing values of categorical features have no entry. """
+    from scipy.sparse import csr_matrix
+    n_samples = data.shape[0]
+    rows, cols, values = [], [], []
+    offset = 0
+    for col in data.columns:
+        column = data[col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = column.cat.codes.to_numpy()
+            present = np.flatnonzero(codes >= 0)
+            rows.append(present)
+            cols.append(offset + codes[present].astype(np.int64))
+            values.append(np.ones(len(present), dtype = np.float32))
+            offset += len(column.cat.categories)
+        else:
+            rows.append(np.arange(n_samples))
+            cols.append(np.full(n_samples, offset, dtype = np.int64))
+            values.append(column.to_numpy(dtype = np.float32))
+            offset += 1
+    matrix = csr_matrix((np.concatenate(values),
+                         (np.concatenate(rows), np.concatenate(cols))),
+                        shape = (n_samples, offset), dtype = np.float32)
+    matrix.eliminate_zeros()
+    return matrix
@@ -36,64 +36,104 @@ References
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
-def read_all(return_type = 'np', scaling = 'None', features = 'continuous'):
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 1
+
+@datamemo.memoized(lambda: [basepath + '/AutoMpg'])
+def read_all(return_type = 'np', scaling = 'None', features = 'continuous',
+             cache = True, return_scaler = False):
     """
-    Reads the complete data file and returns it as a 2D Numpy Array.
-    The alleged Y variable (according to the description) is stored in
-    the last column.
+    Reads the complete data file and returns it as a 2D Numpy Array or pandas
+    DataFrame. The alleged Y variable (according to the description) is
+    stored in the last column.
 
     Parameters
     --------------
-    return_type : string ('np')
+    return_type : string ('np' or 'pd')
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
+        If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
 
     features : string 'all', 'continuous', 'discrete'
         Describes the features that are used. If 'continuous', only features
         with continuous values will be used. If 'discrete', only features with
         discrete values (plus response mpg) will be used.
 
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
+
     Returns
     -------------
     Returns the data object containing the entire excel sheet. If return_type is
     'np', return object is a 2D Numpy Array storing the Y-variable in the last
-    column.
+    column. Else it is a pandas dataframe with the same columns.
     """
+    data = datacache.cached_frame(
+        __name__, [basepath + '/AutoMpg/auto.data'],
+        lambda: _read_source(features), version = __cache_version__,
+        options = {'features' : features},
+        cache = cache)
+    if return_type == 'np':
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
+    elif return_type == 'pd':
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
+    else:
+        raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source(features):
+    """ Reads and cleans the source file, see read_all. """
     data = pd.read_table(basepath + '/AutoMpg/auto.data', sep=',',
         names = ['1cylinders','2displacement','3horsepower','4weight',
                 '5acceleration','6modelyear','7origin','8mpg'])
     # Excluding missing values
-    data = data[~((data['3horsepower'] == '?' ))].astype(float)
+    with datatrace.stage('filter') as stage:
+        data = stage.done(data[~((data['3horsepower'] == '?' ))].astype(float))
     if features == 'continuous':
         data = pd.DataFrame({
-            '1displacement' : data.ix[:,1],
-            '2horsepower' : data.ix[:,2],
-            '3weight' : data.ix[:,3],
-            '4acceleration' : data.ix[:,4],
-            '5mpg' : data.ix[:,7]}
+            '1displacement' : data.iloc[:,1],
+            '2horsepower' : data.iloc[:,2],
+            '3weight' : data.iloc[:,3],
+            '4acceleration' : data.iloc[:,4],
+            '5mpg' : data.iloc[:,7]}
         )
     elif features == 'continuous':
         data = pd.DataFrame({
-            '1cylinders' : data.ix[:,0],
-            '2modelyear' : data.ix[:,5],
-            '3origin' : data.ix[:,6],
-            '4mpg' : data.ix[:,7]}
+            '1cylinders' : data.iloc[:,0],
+            '2modelyear' : data.iloc[:,5],
+            '3origin' : data.iloc[:,6],
+            '4mpg' : data.iloc[:,7]}
         )
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
-    if return_type == 'np':
-        return data.values
-    else:
-        raise RuntimeError("Choose return_type = 'np' to read data.")
+    return data
@@ -51,25 +51,40 @@ References
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
-def read_all(return_type = 'np', scaling = 'None', feature_adjustment = True):
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 1
+
+# Calls (function, options) run by db_hand.build, see datacache
+__build__ = [('read_all', {'feature_adjustment' : adjustment})
+             for adjustment in [True, False]]
+
+@datamemo.memoized(lambda: [basepath + '/California_Housing'])
+def read_all(return_type = 'np', scaling = 'None', feature_adjustment = True,
+             cache = True, return_scaler = False):
     """
-    Reads the complete data file and returns it as a 2D Numpy Array.
-    The alleged Y variable (according to the description) is stored in
-    the last column.
+    Reads the complete data file and returns it as a 2D Numpy Array or pandas
+    DataFrame. The alleged Y variable (according to the description) is
+    stored in the last column.
 
     Parameters
     --------------
-    return_type : string ('np')
+    return_type : string ('np' or 'pd')
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
+        If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
 
     feature_adjustment: If true, we exchange the features by
         longitude
@@ -81,33 +96,60 @@ def read_all(return_type = 'np', scaling = 'None', feature_adjustment = True):
         ln(Households)
         medianIncome
 
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
+
     Returns
     -------------
     Returns the data object containing the entire excel sheet. If return_type is
     'np', return object is a 2D Numpy Array storing the Y-variable in the last
-    column.
+    column. Else it is a pandas dataframe with the same columns.
     """
+    data = datacache.cached_frame(
+        __name__, [basepath + '/California_Housing/cal_housing.data'],
+        lambda: _read_source(feature_adjustment), version = __cache_version__,
+        options = {'feature_adjustment' : feature_adjustment},
+        cache = cache)
+    if return_type == 'np':
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
+    elif return_type == 'pd':
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
+    else:
+        raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source(feature_adjustment):
+    """ Reads and cleans the source file, see read_all. """
     data = pd.read_table(basepath + '/California_Housing/cal_housing.data', sep=',')
-    cols = data.columns.tolist()
     if feature_adjustment:
         data = pd.DataFrame({
-            '1longitude' : data.ix[:,0],
-            '2latitude' : data.ix[:,1],
-            '3lnage' : np.log(data.ix[:,2]),
-            '4lnroomsbypop' : np.log(data.ix[:,3]/data.ix[:,5]),
-            '5lnbedroomsbypop' : np.log(data.ix[:,4]/data.ix[:,5]),
-            '6lnpopbyhouseholds' : np.log(data.ix[:,5]/data.ix[:,6]),
-            '7lnHouseholds' : np.log(data.ix[:,6]),
-            '8income' : data.ix[:,7],
-            '9housevalue' : data.ix[:,8]}
+            '1longitude' : data.iloc[:,0],
+            '2latitude' : data.iloc[:,1],
+            '3lnage' : np.log(data.iloc[:,2]),
+            '4lnroomsbypop' : np.log(data.iloc[:,3]/data.iloc[:,5]),
+            '5lnbedroomsbypop' : np.log(data.iloc[:,4]/data.iloc[:,5]),
+            '6lnpopbyhouseholds' : np.log(data.iloc[:,5]/data.iloc[:,6]),
+            '7lnHouseholds' : np.log(data.iloc[:,6]),
+            '8income' : data.iloc[:,7],
+            '9housevalue' : data.iloc[:,8]}
         )
-        cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
-    if return_type == 'np':
-        return data.values
-    else:
-        raise RuntimeError("Choose return_type = 'np' to read data.")
+    return data
@@ -15,19 +15,41 @@ References
 
 
 """
+from __future__ import print_function
+
 import glob
+import hashlib
+import multiprocessing
 import os
+import re
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
-import matplotlib.pyplot as plt
 import numpy as np
 from skimage import img_as_float, img_as_int
-from skimage.transform import rescale
+from skimage.transform import rescale, resize
+
+import datamemo
+import datatrace
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Resampling matrices per (input shape, scale), see _resampling_matrices
+_resampling_cache = {}
+
+# Index of the database per basepath, see read_index
+_index_cache = {}
+
+# Folder of the compiled database tensors (see load_compiled). If None, the
+# folder CroppedYaleFaces/_compiled is used.
+cachepath = None
+
 def read_single(nr_subject, first_angle, second_angle, scale=1.0,
-                datatype="float"):
+                datatype="float", dtype=None):
     """ Read and return a single face with the given subject nr, and first and
     second angle's of illumination. The inputs are preprocessed before reading
     the face, meaning that integer values will be transformed into the correct
@@ -53,6 +75,13 @@ def read_single(nr_subject, first_angle, second_angle, scale=1.0,
         unchanged. If datatype is "float" the images will converted to floating
         point values in [0,1].
 
+    dtype : numpy dtype or None
+        If None, images are returned as float64 as determined by datatype.
+        If np.float32 (or another float type), the images are converted and
+        rescaled in this precision without intermediate int16/float64 copies.
+        If np.uint8, the raw pixel values are kept (rescaled images are
+        rounded back to uint8).
+
     Returns
     ------------
     Numpy array with image values of the face. Datatype depends on input
@@ -78,10 +107,10 @@ def read_single(nr_subject, first_angle, second_angle, scale=1.0,
         second_angle = "+{0}".format(str(second_angle).zfill(2))
     loadstr = basepath+"/CroppedYaleFaces/yaleB{0}/yaleB{0}_P00A{1}E{2}.pgm".format(
         nr_subject, first_angle, second_angle)
-    return read_single_filename(loadstr, scale, datatype)
+    return read_single_filename(loadstr, scale, datatype, dtype)
 
 
-def read_single_filename(fn, scale=1.0, datatype="float"):
+def read_single_filename(fn, scale=1.0, datatype="float", dtype=None):
     """ Read and return a single face from given filename. Returns it as a
     numpy array.
 
@@ -99,10 +128,18 @@ def read_single_filename(fn, scale=1.0, datatype="float"):
         unchanged. If datatype is "float" the images will converted to floating
         point values in [0,1].
 
+    dtype : numpy dtype or None
+        If None, images are returned as float64 as determined by datatype.
+        If np.float32 (or another float type), the images are converted and
+        rescaled in this precision without intermediate int16/float64 copies.
+        If np.uint8, the raw pixel values are kept (rescaled images are
+        rounded back to uint8).
+
     Returns
     ------------
     Numpy array with image values of the face. Datatype depends on input
-    argument (see datatype).
+    argument (see datatype). Raises a ValueError for 16 bit images
+    (maxval > 255), see _check_depth.
 
     Example
     -----------
@@ -114,13 +151,32 @@ def read_single_filename(fn, scale=1.0, datatype="float"):
     Reads face from file CroppedYaleFaces/yaleB01/yaleB01_P00A-070E+00.pgm as
     numpy array (float in [0, 1]).
     """
-    with open(fn) as f:
-        data = np.array(read_pgm(f)).astype('int16')
+    return _convert(read_pgm_filename(fn), scale, datatype, dtype)
+
+
+def _convert(raw, scale, datatype, dtype=None):
+    """ Converts a raw PGM raster according to datatype or dtype and rescales
+    it. """
+    _check_depth(raw)
+    if dtype is not None:
+        return rescale_batch(raw[np.newaxis], scale, dtype=dtype)[0]
+    data = raw.astype('int16')
     if datatype == "float":
         data = img_as_float(img_as_int(data))
     return rescale(data, scale)
 
 
+def _check_depth(raw):
+    """ Raises a ValueError if raw holds 16 bit values (maxval > 255). The
+    conversion treats raw values as int16 (values above 32767 would wrap
+    around) and the uint8 output keeps raw values, so only 8 bit images are
+    supported. """
+    if raw.dtype.itemsize > 1:
+        raise ValueError("Only 8 bit PGM images (maxval <= 255) can be "
+                         "converted. Use read_pgm_filename to read the raw "
+                         "16 bit values.")
+
+
 def read_ambient(nr_subject, scale=1.0, datatype="float"):
     """ Read and return a single ambient image related to a specific subject.
     The input is preprocessed before reading the face, meaning that integer
@@ -157,15 +213,11 @@ def read_ambient(nr_subject, scale=1.0, datatype="float"):
     nr_subject = str(nr_subject).zfill(2)
     loadstr = basepath+"/CroppedYaleFaces/yaleB{0}/yaleB{0}_P00_Ambient.pgm".format(
         nr_subject)
-    with open(loadstr) as f:
-        data = np.array(read_pgm(f)).astype('int16')
-    if datatype == "float":
-        data = img_as_float(img_as_int(data))
-    return rescale(data, scale)
+    return _convert(read_pgm_filename(loadstr), scale, datatype)
 
 
 def read_subject_all(nr_subject, scale=1.0, datashape="columns",
-                     datatype="float"):
+                     datatype="float", workers=1, batched=True, dtype=None):
     """ Reads and returns all images for a single subject with the given number.
 
     Parameters
@@ -189,6 +241,25 @@ def read_subject_all(nr_subject, scale=1.0, datashape="columns",
         unchanged. If datatype is "float" the images will converted to floating
         point values in [0,1].
 
+    workers : Integer
+        Number of processes used to decode and rescale the images. If
+        workers > 1, the images are written by a process pool directly into
+        a shared output array. The result equals the serial one (workers = 1).
+
+    batched : Boolean
+        If True (default), all images are stacked and converted and rescaled
+        at once by two precomputed resampling matrices (see rescale_batch)
+        instead of calling skimage.rescale per image. The result equals the
+        per-image one (batched = False) up to floating point rounding. With
+        workers > 1, every chunk of images of the pool is processed at once.
+
+    dtype : numpy dtype or None
+        If None, the returned array is float64 as determined by datatype.
+        If np.float32 (or another float type), the images are converted and
+        rescaled in this precision without intermediate int16/float64 copies.
+        If np.uint8, the raw pixel values are kept (rescaled images are
+        rounded back to uint8).
+
     Returns
     -------------
     Returns the data object containing all images of the respective subject.
@@ -201,25 +272,35 @@ def read_subject_all(nr_subject, scale=1.0, datashape="columns",
             # data[1] contains (n_pixel, n_images) matrix with all images related
             # to subject 1
     """
-    nr_subject = str(nr_subject).zfill(2)
-    files = glob.glob(basepath+'/CroppedYaleFaces/yaleB{0}/*.pgm'.format(nr_subject))
-    # Remove ambient image
-    files = [item for item in files if "Ambient" not in item]
+    files = _subject_files(nr_subject)
+    if workers > 1:
+        data = _decode_parallel(files, scale, datatype, workers, dtype,
+                                batched)
+        return _split_subjects(data, [(nr_subject, len(files))],
+                               datashape)[nr_subject]
+    if batched:
+        data = rescale_batch(np.stack([read_pgm_filename(fn) for fn in files]),
+                             scale, datatype, dtype)
+        return _split_subjects(data, [(nr_subject, len(files))],
+                               datashape)[nr_subject]
     # Get first image for extracting data format
-    I = read_single_filename(files[0], scale, datatype)
+    I = read_single_filename(files[0], scale, datatype, dtype)
     if datashape == "matrices":
-        data = np.zeros((len(files), I.shape[0], I.shape[1]))
+        data = np.zeros((len(files), I.shape[0], I.shape[1]), dtype=I.dtype)
         for i, fn in enumerate(files):
-            data[i, :, :] = read_single_filename(fn, scale, datatype)
+            data[i, :, :] = read_single_filename(fn, scale, datatype, dtype)
     elif datashape == "columns":
-        data = np.zeros((I.shape[0] * I.shape[1], len(files)))
+        data = np.zeros((I.shape[0] * I.shape[1], len(files)), dtype=I.dtype)
         for i, fn in enumerate(files):
-            data[:, i] = read_single_filename(fn, scale, datatype).ravel()
+            data[:, i] = read_single_filename(fn, scale, datatype,
+                                              dtype).ravel()
     return data
 
 
+@datamemo.memoized(lambda: [basepath + '/CroppedYaleFaces'])
 def read_all(scale=1.0, datashape="columns", datatype="float",
-             until_subject = 100):
+             until_subject = 100, workers=1, cache=False, batched=True,
+             dtype=None, layout="dict"):
     """ Reads and returns all images of the database. Format of returned
     python dict depends on the input datashape.
 
@@ -248,34 +329,615 @@ def read_all(scale=1.0, datashape="columns", datatype="float",
         does not have an effect if it exceeds the number of faces in the
         data base.
 
+    workers : Integer
+        Number of processes used to decode and rescale the images. If
+        workers > 1, all images of all subjects are distributed over a process
+        pool which writes directly into one shared output array. The arrays of
+        the returned dict are views into this array and equal the serial
+        result (workers = 1).
+
+    cache : Boolean
+        If True, the database is read through load_compiled, i.e. the first
+        call for a given scale and datatype writes a compiled tensor to disk
+        and later calls memory-map it. The arrays of the returned dict are
+        then read-only views into the memory map.
+
+    batched : Boolean
+        If True (default), the images of each subject are converted and
+        rescaled at once (see read_subject_all), else per image with
+        skimage.rescale. Also applies to the chunks of the process pool if
+        workers > 1, so the result does not depend on workers.
+
+    dtype : numpy dtype or None
+        If None, the returned arrays are float64 as determined by datatype.
+        If np.float32 (or another float type), the images are converted and
+        rescaled in this precision without intermediate int16/float64 copies.
+        If np.uint8, the raw pixel values are kept (rescaled images are
+        rounded back to uint8).
+
+    layout : string
+        If layout = "dict", a python dict with one array per subject is
+        returned (see datashape). If layout = "tensor", all images are
+        written into one preallocated array which is returned together with
+        an integer vector of the subject number of every image. For
+        datashape = "matrices" the array is a C-contiguous
+        (n_images, n_pixel_x, n_pixel y) array, for datashape = "columns" a
+        Fortran-contiguous (n_pixel, n_images) matrix, so it can be passed to
+        SVD/PCA routines without copies.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
+
     Returns
     -------------
     Returns the data object containing all images of the database.
     Note that the ambient image of each subject of the database is left out.
     Moreover, the representation/shape of the returned object depends on the
-    chosen datashape.
+    chosen datashape and layout.
 
     Example
     -------------
     In [3]: data = read_all(datashape = "columns", datatype = "float")
-    In [4]: data.shape
-    Out[4]: (39, 32256, 64)
+    In [4]: len(data), data[1].shape
+    Out[4]: (38, (32256, 64))
+    In [5]: data, labels = read_all(datashape = "columns", layout = "tensor")
+    In [6]: data.shape, labels.shape
+    Out[6]: ((32256, 2432), (2432,))
     """
     retr = {}
-    counter = 1
+    print("Loading database...")
+    if cache:
+        with datatrace.stage('load') as stage:
+            data, index = stage.done(load_compiled(scale, datatype,
+                                                   until_subject, workers,
+                                                   dtype, batched))
+        subjects, counts = np.unique(index['subject'], return_counts=True)
+        subject_counts = list(zip(subjects.tolist(), counts.tolist()))
+    else:
+        subjects = _subject_numbers(until_subject)
+        subject_files = [(nr, _subject_files(nr)) for nr in subjects]
+        subject_counts = [(nr, len(files)) for nr, files in subject_files]
+        with datatrace.stage('parse') as stage:
+            if workers > 1:
+                data = _decode_parallel([fn for _, files in subject_files
+                                         for fn in files], scale, datatype,
+                                        workers, dtype, batched)
+                for counter in subjects:
+                    print("Loading data ", counter)
+            elif layout == "tensor":
+                data = _decode_serial(subject_files, scale, datatype, batched,
+                                      dtype)
+            else:
+                for counter in subjects:
+                    retr[counter] = read_subject_all(counter, scale, datashape,
+                                                     datatype, batched=batched,
+                                                     dtype=dtype)
+                    print("Loading data ", counter)
+                return stage.done(retr)
+            stage.done(data)
+    if layout == "tensor":
+        labels = np.repeat([nr for nr, _ in subject_counts],
+                           [count for _, count in subject_counts])
+        if datashape == "columns":
+            data = data.reshape(len(labels), -1).T
+        return data, labels
+    return _split_subjects(data, subject_counts, datashape)
+
+
+def _decode_serial(subject_files, scale, datatype, batched=False, dtype=None):
+    """ Reads the images of the given (nr_subject, files) pairs one after
+    another into one preallocated (n_images, n_pixel_x, n_pixel_y) array. """
+    n_total = sum(len(files) for _, files in subject_files)
+    data, slot = None, 0
+    for nr_subject, files in subject_files:
+        if batched:
+            images = [rescale_batch(np.stack([read_pgm_filename(fn)
+                                              for fn in files]),
+                                    scale, datatype, dtype)]
+        else:
+            images = (read_single_filename(fn, scale, datatype, dtype)[np.newaxis]
+                      for fn in files)
+        for block in images:
+            if data is None:
+                data = np.empty((n_total,) + block.shape[1:], dtype=block.dtype)
+            data[slot:slot + len(block)] = block
+            slot += len(block)
+        print("Loading data ", nr_subject)
+    return data
+
+
+def _subject_numbers(until_subject=100):
+    """ Returns the sorted numbers of all subjects in the database which are
+    smaller or equal than until_subject. """
     subject_dirs = [item for item in os.listdir(basepath+"/CroppedYaleFaces/")
                         if item[0:4] == 'yale']
-    print "Loading database..."
-    while len(subject_dirs) > 0 and counter <= until_subject:
-        if os.path.isdir(basepath+"/CroppedYaleFaces/yaleB{0}".format(
-                str(counter).zfill(2))):
-            retr[counter] = read_subject_all(counter, scale, datashape,
-                                             datatype)
-            subject_dirs.remove("yaleB{0}".format(str(counter).zfill(2)))
-            print "Loading data ", counter
-        counter += 1
+    return [counter for counter in range(1, until_subject + 1)
+            if "yaleB{0}".format(str(counter).zfill(2)) in subject_dirs and
+            os.path.isdir(basepath+"/CroppedYaleFaces/yaleB{0}".format(
+                str(counter).zfill(2)))]
+
+
+def _subject_files(nr_subject):
+    """ Returns the filenames of all images of a subject, except the ambient
+    image. """
+    nr_subject = str(nr_subject).zfill(2)
+    files = glob.glob(basepath+'/CroppedYaleFaces/yaleB{0}/*.pgm'.format(nr_subject))
+    # Remove ambient image
+    return [item for item in files if "Ambient" not in item]
+
+
+# Shared output array of the worker processes, set by _init_worker
+_shared_out = None
+
+
+def _init_worker(raw, shape, dtype):
+    global _shared_out
+    _shared_out = np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+def _decode_into(task):
+    """ Decodes a chunk of images and writes them into their slots of the
+    shared output array. Only the first slot index is sent back to the parent
+    process. If batched, the chunk is converted and rescaled at once by
+    rescale_batch, which gives the same values per image as the serial
+    batched path. """
+    start, fns, scale, datatype, dtype, batched = task
+    if batched:
+        data = rescale_batch(np.stack([read_pgm_filename(fn) for fn in fns]),
+                             scale, datatype, dtype)
+    else:
+        data = [read_single_filename(fn, scale, datatype, dtype) for fn in fns]
+    for slot, image in enumerate(data, start):
+        _shared_out[slot] = image.ravel()
+    return start
+
+
+def rescale_batch(raw, scale=1.0, datatype="float", dtype=None):
+    """ Converts and rescales a stack of raw PGM rasters at once.
+
+    Equals calling _convert (i.e. skimage's img_as_float and rescale) on every
+    image up to floating point rounding. Since the conversion to float, the
+    anti-aliasing filter and the bilinear interpolation of rescale are all
+    separable linear operators, the whole stack is processed by two matrix
+    products R * I * C^T with matrices computed once per image shape and scale.
+
+    Parameters
+    --------------
+    raw : Numpy array
+        Raw rasters with shape (n_images, n_pixel_x, n_pixel_y).
+
+    scale : Float in (0, 1)
+        Float value passed to skimage.scale to rescale the images to a smaller
+        size if desired.
+
+    datatype : string
+        Datatype of the image. Does not change the result, since rescale
+        converts integer images to floats in the same way as img_as_float.
+
+    dtype : numpy dtype or None
+        Datatype of the result and of the computation. If None, float64 is
+        used. If np.uint8, the raw pixel values are rescaled and rounded.
+
+    Returns
+    -------------
+    Numpy array of shape (n_images, n_pixel_x', n_pixel_y'). Raises a
+    ValueError for 16 bit rasters, see _check_depth.
+    """
+    _check_depth(raw)
+    dtype = np.dtype(np.float64 if dtype is None else dtype)
+    keep_range = dtype == np.uint8
+    work_dtype = np.float32 if keep_range else dtype
+    rows, cols = _resampling_matrices(raw.shape[1:], scale)
+    if rows is None:
+        if keep_range:
+            return raw.astype(dtype)
+        # Identity resampling, only convert like img_as_float(int16)
+        data = raw.astype(work_dtype)
+        data *= work_dtype.type(1.0 / np.iinfo(np.int16).max)
+        return data
+    rows = rows.astype(work_dtype)
+    if not keep_range:
+        rows *= work_dtype.type(1.0 / np.iinfo(np.int16).max)
+    data = np.matmul(np.matmul(rows, raw.astype(work_dtype)),
+                     cols.astype(work_dtype).T)
+    if keep_range:
+        return np.clip(np.rint(data, out=data), 0, 255).astype(dtype)
+    return data
+
+
+def _resampling_matrices(shape, scale):
+    """ Returns the matrices (R, C) such that R * I * C^T equals
+    skimage.rescale(I, scale, preserve_range=True) for float images I of the
+    given shape, or (None, None) if rescale does not change the image.
+
+    R and C are obtained by resizing identity matrices along one axis only,
+    which applies exactly the 1D filter and interpolation rescale uses on that
+    axis.
+    """
+    key = (tuple(shape), float(scale))
+    if key not in _resampling_cache:
+        out_shape = np.maximum(np.round(scale * np.asarray(shape)), 1)
+        out_shape = tuple(out_shape.astype(int))
+        if out_shape == tuple(shape):
+            _resampling_cache[key] = (None, None)
+        else:
+            anti_aliasing = any(o < i for o, i in zip(out_shape, shape))
+            _resampling_cache[key] = tuple(
+                resize(np.eye(n_in), (n_out, n_in), anti_aliasing=anti_aliasing)
+                for n_in, n_out in zip(shape, out_shape))
+    return _resampling_cache[key]
+
+
+def _decode_parallel(files, scale, datatype, workers, dtype=None,
+                     batched=True):
+    """ Reads the images with the given filenames with a pool of worker
+    processes, in chunks of images (see _decode_into).
+
+    All images are written into one preallocated shared array, so no image
+    data is pickled back to the parent. Returns this array with shape
+    (n_images, n_pixel_x, n_pixel_y).
+    """
+    img_shape = read_single_filename(files[0], scale, datatype, dtype).shape
+    n_pixel = img_shape[0] * img_shape[1]
+    out_dtype = np.dtype(np.float64 if dtype is None else dtype)
+    raw = multiprocessing.RawArray('b', len(files) * n_pixel *
+                                   out_dtype.itemsize)
+    chunk = max(1, len(files) // (4 * workers))
+    tasks = [(start, files[start:start + chunk], scale, datatype, dtype,
+              batched) for start in range(0, len(files), chunk)]
+    pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                initargs=(raw, (len(files), n_pixel),
+                                          out_dtype.str))
+    try:
+        for _ in pool.imap_unordered(_decode_into, tasks):
+            pass
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return np.frombuffer(raw, dtype=out_dtype).reshape(
+        (len(files),) + img_shape)
+
+
+def _split_subjects(data, subject_counts, datashape):
+    """ Splits a (n_images, n_pixel_x, n_pixel_y) array, holding the images of
+    the given (nr_subject, n_images) pairs consecutively, into a dict with one
+    view per subject shaped as in read_subject_all. """
+    retr, start = {}, 0
+    for nr_subject, count in subject_counts:
+        block = data[start:start + count]
+        start += count
+        if datashape == "matrices":
+            retr[nr_subject] = block
+        elif datashape == "columns":
+            retr[nr_subject] = block.reshape(count, -1).T
     return retr
 
+
+def load_compiled(scale=1.0, datatype="float", until_subject=100, workers=1,
+                  dtype=None, batched=True):
+    """ Returns all images of the database as one memory-mapped tensor plus an
+    index holding subject and illumination angles for every image.
+
+    The first call for a given scale and datatype decodes the database and
+    writes the tensor as .npy file to the cachepath folder. Later calls only
+    memory-map this file. The file name contains a hash over the size and
+    modification time of every source image, so the tensor is rebuilt
+    whenever the database changes.
+
+    Parameters
+    --------------
+    scale : Float in (0, 1)
+        Float value passed to skimage.scale to rescale the images to a smaller
+        size if desired.
+
+    datatype : string
+        Datatype of the image. If datatype is "int", the images will remain
+        unchanged. If datatype is "float" the images will converted to floating
+        point values in [0,1].
+
+    until_subject : Integer
+        Can be used as an upper boundary for subjects considered.
+
+    workers : Integer
+        Number of processes used to decode the images if the tensor has to be
+        built.
+
+    dtype : numpy dtype or None
+        Datatype of the tensor, see read_all. If None, the images are decoded
+        as by read_single_filename with dtype = None (float64).
+
+    batched : Boolean
+        If True, the images are decoded per subject by rescale_batch, else
+        per image, see read_all.
+
+    Returns
+    -------------
+    Tuple (data, index). data is a read-only (n_images, n_pixel_x, n_pixel_y)
+    np.memmap, index a structured array with fields 'subject', 'azimuth' and
+    'elevation' of length n_images. Images are ordered by subject.
+
+    Example
+    -------------
+    In [3]: data, index = load_compiled(scale = 0.25)
+    In [4]: data[index['subject'] == 1].shape
+    Out[4]: (64, 48, 42)
+    """
+    subject_files = [(nr, _subject_files(nr))
+                     for nr in _subject_numbers(until_subject)]
+    files = [fn for _, files in subject_files for fn in files]
+    prefix = "yale_{0}_{1}_{2}_{3}_{4}_".format(
+        repr(float(scale)), datatype,
+        'default' if dtype is None else np.dtype(dtype).name,
+        'batched' if batched else 'single', len(subject_files))
+    stamp = hashlib.sha1(repr([(os.path.relpath(fn, basepath),
+                                os.stat(fn).st_size, os.stat(fn).st_mtime)
+                               for fn in files]).encode('utf8')).hexdigest()
+    folder = cachepath or basepath + "/CroppedYaleFaces/_compiled"
+    data_fn = os.path.join(folder, prefix + stamp + ".npy")
+    index_fn = os.path.join(folder, prefix + stamp + "_index.npy")
+    if not (os.path.isfile(data_fn) and os.path.isfile(index_fn)):
+        index = np.zeros(len(files), dtype=[('subject', 'i2'),
+                                            ('azimuth', 'i2'),
+                                            ('elevation', 'i2')])
+        slot = 0
+        for nr_subject, subject_fns in subject_files:
+            for fn in subject_fns:
+                index[slot] = (nr_subject,) + _parse_angles(fn)
+                slot += 1
+        if workers > 1:
+            data = _decode_parallel(files, scale, datatype, workers, dtype,
+                                    batched)
+        elif batched:
+            data = np.concatenate([
+                rescale_batch(np.stack([read_pgm_filename(fn) for fn in fns]),
+                              scale, datatype, dtype)
+                for _, fns in subject_files])
+        else:
+            data = np.stack([read_single_filename(fn, scale, datatype, dtype)
+                             for fn in files])
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        # Remove stale tensors for this scale and datatype, but never the
+        # temporary files of concurrent builders
+        for item in os.listdir(folder):
+            if item.startswith(prefix) and \
+                    not item.startswith(prefix + stamp) and '.tmp' not in item:
+                try:
+                    os.remove(os.path.join(folder, item))
+                except OSError:
+                    # Removed by a concurrent builder
+                    pass
+        # Write to temporary files (per process) first such that concurrent
+        # readers never see partially written tensors
+        for fn, array in [(index_fn, index), (data_fn, data)]:
+            tmp = fn + ".tmp{0}".format(os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, fn)
+    return np.load(data_fn, mmap_mode='r'), np.load(index_fn)
+
+
+def _parse_angles(fn):
+    """ Returns the (azimuth, elevation) illumination angles encoded in the
+    filename of an image, e.g. (-70, 0) for yaleB01_P00A-070E+00.pgm. """
+    match = re.search(r"A([+-]\d+)E([+-]\d+)", os.path.basename(fn))
+    return int(match.group(1)), int(match.group(2))
+
+
+def read_index(rebuild=False):
+    """ Returns an index over all images of the database (ambient images
+    excluded).
+
+    The index is built once per process by parsing the filenames and PGM
+    headers of all images and is reused by later calls and by read_query.
+
+    Parameters
+    --------------
+    rebuild : Boolean
+        If True, the index is rebuilt, e.g. after files have been added.
+
+    Returns
+    -------------
+    Structured numpy array with fields 'subject', 'azimuth', 'elevation',
+    'path', 'offset' (byte offset of the raster in the file), 'height',
+    'width' and 'maxval'. Entries are sorted by subject, azimuth and
+    elevation.
+    """
+    if rebuild or basepath not in _index_cache:
+        entries = []
+        for nr_subject in _subject_numbers():
+            for fn in _subject_files(nr_subject):
+                with open(fn, 'rb') as f:
+                    head = f.read(1024)
+                width, height, maxval, offset = _parse_pgm_header(head)
+                entries.append((nr_subject,) + _parse_angles(fn) +
+                               (fn, offset, height, width, maxval))
+        entries.sort(key=lambda entry: entry[0:3])
+        _index_cache[basepath] = np.array(
+            entries, dtype=[('subject', 'i2'), ('azimuth', 'i2'),
+                            ('elevation', 'i2'), ('path', 'O'),
+                            ('offset', 'i8'), ('height', 'i4'),
+                            ('width', 'i4'), ('maxval', 'i4')])
+    return _index_cache[basepath]
+
+
+def read_query(subjects=None, azimuth=None, elevation=None, scale=1.0,
+               datashape="matrices", datatype="float", dtype=None):
+    """ Reads and returns all images matching the given subjects and
+    illumination angles. Only the matching images are read from disk.
+
+    Each selector can be None (no restriction), a tuple (low, high) giving an
+    inclusive range, or a list of admissible values.
+
+    Parameters
+    --------------
+    subjects : None, tuple or list
+        Selected subject numbers, e.g. (1, 10) for subjects 1 to 10.
+
+    azimuth : None, tuple or list
+        Selected first illumination angles, e.g. [-70, 0, 70].
+
+    elevation : None, tuple or list
+        Selected second illumination angles, e.g. (-20, 20).
+
+    scale : Float in (0, 1)
+        Float value passed to skimage.scale to rescale the images to a smaller
+        size if desired.
+
+    datashape : string
+        If datashape = "matrices", a (n_images, n_pixel_x, n_pixel y) array is
+        returned. If datashape = "columns", each image resembles a column of a
+        (n_pixel, n_images) matrix.
+
+    datatype : string
+        Datatype of the image. If datatype is "int", the images will remain
+        unchanged. If datatype is "float" the images will converted to floating
+        point values in [0,1].
+
+    dtype : numpy dtype or None
+        Datatype of the returned images, see read_all.
+
+    Returns
+    -------------
+    Tuple (data, index) where data holds the matching images ordered by
+    subject, azimuth and elevation, and index the matching entries of
+    read_index in the same order. If no image matches, data has 0 images of
+    the shape and dtype of the others.
+
+    Example
+    -------------
+    In [3]: data, index = read_query(subjects = (1, 10), elevation = (-20, 20))
+    """
+    index = _query_index(subjects, azimuth, elevation)
+    data = None
+    for i, entry in enumerate(index):
+        img = _convert(_read_raw(entry), scale, datatype, dtype)
+        if data is None:
+            data = np.zeros((len(index),) + img.shape, dtype=img.dtype)
+        data[i] = img
+    if data is None:
+        # No match, the first image of the database gives shape and dtype
+        img = _convert(_read_raw(read_index()[0]), scale, datatype, dtype)
+        data = np.zeros((0,) + img.shape, dtype=img.dtype)
+    if datashape == "columns":
+        data = data.reshape(len(index), data.shape[1] * data.shape[2]).T
+    return data, index
+
+
+def iter_faces(batch_size=64, scale=1.0, dtype=np.float64, subjects=None,
+               azimuth=None, elevation=None, prefetch=2):
+    """ Generator over the images of the database in fixed-size batches.
+
+    Batches are read, converted and rescaled (see rescale_batch) by a
+    background thread ahead of the consumer. The thread blocks as soon as
+    prefetch batches are waiting, so at most prefetch + 2 batches (waiting,
+    in preparation, and the one handed out) are held in memory at any time.
+
+    Parameters
+    --------------
+    batch_size : Integer
+        Number of images per batch. The last batch may be smaller.
+
+    scale : Float in (0, 1)
+        Float value passed to skimage.scale to rescale the images to a smaller
+        size if desired.
+
+    dtype : numpy dtype
+        Datatype of the yielded images, e.g. np.float32 to halve the memory
+        or np.uint8 for raw pixel values (see rescale_batch).
+
+    subjects, azimuth, elevation : None, tuple or list
+        Selection of images as in read_query.
+
+    prefetch : Integer
+        Maximal number of batches prepared ahead of the consumer.
+
+    Yields
+    -------------
+    Tuples (data, labels) where data is a (n_batch, n_pixel_x, n_pixel_y)
+    array and labels the matching entries of read_index (subject, azimuth,
+    elevation, ...). Batches follow the order of read_index.
+
+    Example
+    -------------
+    In [3]: for data, labels in iter_faces(batch_size = 128, scale = 0.25,
+       ...:                                dtype = np.float32):
+       ...:     ipca.partial_fit(data.reshape(len(data), -1))
+    """
+    index = _query_index(subjects, azimuth, elevation)
+    batches = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+
+    def put(item):
+        # Returns False if the consumer stopped while waiting for a free slot
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for start in range(0, len(index), batch_size):
+                labels = index[start:start + batch_size]
+                raw = np.stack([_read_raw(entry) for entry in labels])
+                if not put((rescale_batch(raw, scale, dtype=dtype), labels)):
+                    return
+        except Exception as e:
+            put(e)
+            return
+        put(None)
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            item = batches.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Release the producer if the consumer stops early
+        stop.set()
+        producer.join()
+
+
+def _query_index(subjects=None, azimuth=None, elevation=None):
+    """ Returns the entries of read_index matching the given selectors. """
+    index = read_index()
+    mask = (_select(index['subject'], subjects) &
+            _select(index['azimuth'], azimuth) &
+            _select(index['elevation'], elevation))
+    return index[mask]
+
+
+def _read_raw(entry):
+    """ Reads the raw raster of an entry of read_index. """
+    raw = np.fromfile(entry['path'], dtype=_pgm_dtype(entry['maxval']),
+                      count=entry['height'] * entry['width'],
+                      offset=entry['offset'])
+    return raw.reshape(entry['height'], entry['width'])
+
+
+def _select(values, selector):
+    """ Returns a boolean mask of values matching the selector, which is None,
+    an inclusive (low, high) range or a list of admissible values. """
+    if selector is None:
+        return np.ones(len(values), dtype=bool)
+    if isinstance(selector, tuple):
+        return (values >= selector[0]) & (values <= selector[1])
+    return np.isin(values, selector)
+
+
 def get_image_format_for_scale(scale=1.0):
     """ Function to get the image shape. Uses the image
     CroppedYaleFaces/yaleB01/yaleB01_P00A-070E+00.pgm, loads this for the given
@@ -296,29 +958,107 @@ def get_image_format_for_scale(scale=1.0):
 
 
 def read_pgm(pgmf):
-    """ Return a raster of integers from a PGM as a list of lists.
+    """ Return the raster of a binary (P5) PGM as a 2D numpy array.
+
+    The header is parsed once and the raster is wrapped with np.frombuffer,
+    so no per-pixel work is done in Python. Comment lines in the header are
+    skipped and files with maxval > 255 are read as 16 bit big-endian values
+    as defined by the PGM format.
 
     Parameters
     ------------
     pgmf: Python file object
-        File object that opened a pgm file.
+        File object that opened a pgm file in binary mode.
 
     Returns
     -------------
-    List of lists with integers containing the content of the pgm file.
+    Read-only numpy array of shape (height, width) with dtype uint8 if
+    maxval <= 255, and dtype '>u2' (big-endian uint16) otherwise.
+    """
+    buf = pgmf.read()
+    width, height, maxval, offset = _parse_pgm_header(buf)
+    return np.frombuffer(buf, dtype=_pgm_dtype(maxval), count=width * height,
+                         offset=offset).reshape(height, width)
 
-    Source
-    -----------
-    http://stackoverflow.com/questions/35723865/read-a-pgm-file-in-python
+
+def read_pgm_filename(fn, mmap=False):
+    """ Return the raster of the binary (P5) PGM file with the given filename
+    as a 2D numpy array. See read_pgm.
+
+    Parameters
+    ------------
+    fn : string
+        Filename of the pgm file.
+
+    mmap : Boolean
+        If True, the raster is returned as a read-only np.memmap on the file
+        instead of being read into memory.
+
+    Returns
+    -------------
+    Numpy array of shape (height, width) with dtype uint8 if maxval <= 255,
+    and dtype '>u2' (big-endian uint16) otherwise.
+    """
+    if not mmap:
+        with open(fn, 'rb') as f:
+            return read_pgm(f)
+    with open(fn, 'rb') as f:
+        # Headers are tiny, but comments may make them arbitrarily long
+        chunk = 256
+        while True:
+            head = f.read(chunk)
+            f.seek(0)
+            try:
+                width, height, maxval, offset = _parse_pgm_header(head)
+                break
+            except ValueError:
+                if len(head) < chunk:
+                    raise
+                chunk *= 4
+    return np.memmap(fn, dtype=_pgm_dtype(maxval), mode='r', offset=offset,
+                     shape=(height, width))
+
+
+def _pgm_dtype(maxval):
+    """ Returns the numpy dtype of the raster for the given maxval. """
+    if maxval < 256:
+        return np.dtype('u1')
+    return np.dtype('>u2')
+
+
+def _parse_pgm_header(buf):
+    """ Parses the header of a binary (P5) PGM given as bytes.
+
+    Returns
+    -------------
+    Tuple (width, height, maxval, offset) where offset is the position of the
+    first raster byte in buf.
     """
-    assert pgmf.readline() == 'P5\n'
-    (width, height) = [int(i) for i in pgmf.readline().split()]
-    depth = int(pgmf.readline())
-    assert depth <= 255
-    raster = []
-    for y in range(height):
-        row = []
-        for y in range(width):
-            row.append(ord(pgmf.read(1)))
-        raster.append(row)
-    return raster
+    if buf[0:2] != b'P5':
+        raise ValueError("Not a binary PGM (P5) file.")
+    n = len(buf)
+    pos = 2
+    fields = []
+    while len(fields) < 3:
+        # Skip whitespace and comments up to the next header field
+        while pos < n:
+            c = buf[pos:pos + 1]
+            if c == b'#':
+                eol = min([i for i in (buf.find(b'\n', pos), buf.find(b'\r', pos))
+                           if i >= 0] or [n])
+                pos = eol + 1
+            elif c.isspace():
+                pos += 1
+            else:
+                break
+        start = pos
+        while pos < n and buf[pos:pos + 1].isdigit():
+            pos += 1
+        if start == pos or pos >= n:
+            raise ValueError("Truncated or malformed PGM header.")
+        fields.append(int(buf[start:pos]))
+    width, height, maxval = fields
+    if not 0 < maxval < 65536:
+        raise ValueError("Invalid PGM maxval {0}.".format(maxval))
+    # Exactly one whitespace character separates maxval from the raster
+    return width, height, maxval, pos + 1
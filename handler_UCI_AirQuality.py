@@ -59,15 +59,24 @@ import os
 
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 2
+
 __exclude_features__ = [
     'NMHC(GT)' #  Many missing values
 ]
-def read_all(return_type = 'np', scaling = 'None'):
+@datamemo.memoized(lambda: [basepath + '/UCI_AirQuality'])
+def read_all(return_type = 'np', scaling = 'None', cache = True, dtype = None,
+             return_scaler = False):
     """
     Reads the complete excel sheet and returns it as a 2D Numpy Array or pandas
     DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
@@ -79,8 +88,29 @@ def read_all(return_type = 'np', scaling = 'None'):
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
         If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    dtype : numpy dtype or None
+        Datatype of the returned 2D Numpy Array, e.g. np.float32. If None, the
+        common type of the columns (np.float64) is used.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
@@ -89,26 +119,38 @@ def read_all(return_type = 'np', scaling = 'None'):
     column. Else it is a pandas dataframe with the descriptors given in the
     excel sheet.
     """
-    data = pd.read_csv(basepath + '/UCI_AirQuality/AirQualityUCI.csv', sep = ';',
-                       nrows = 9357,
-                       usecols = ['CO(GT)',	'PT08.S1(CO)','C6H6(GT)','PT08.S2(NMHC)','NOx(GT)',
-                                  'PT08.S3(NOx)','NO2(GT)','PT08.S4(NO2)','PT08.S5(O3)',
-                                  'T','RH','AH'])
-    # Excluding missing values
-    cols = data.columns.tolist()
-    for col in cols:
-        data = data[data[col] != -200]
-        if col in ['CO(GT)', 'C6H6(GT)', 'T', 'RH', 'AH']:
-            data[col] = data[col].apply(lambda x: x.replace(',','.'))
-            data[col] = pd.to_numeric(data[col])
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
+    data = datacache.cached_frame(
+        __name__, [basepath + '/UCI_AirQuality/AirQualityUCI.csv'],
+        _read_source, version = __cache_version__,
+        cache = cache)
     if return_type == 'np':
-        return data.values
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place (in float64)
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
+        if dtype is not None:
+            data = data.astype(dtype, copy = False)
     elif return_type == 'pd':
-        return data
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
     else:
         raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source():
+    """ Reads and cleans the source file, see read_all. """
+    data = pd.read_csv(basepath + '/UCI_AirQuality/AirQualityUCI.csv', sep = ';',
+                       decimal = ',', nrows = 9357,
+                       usecols = ['CO(GT)',	'PT08.S1(CO)','C6H6(GT)','PT08.S2(NMHC)','NOx(GT)',
+                                  'PT08.S3(NOx)','NO2(GT)','PT08.S4(NO2)','PT08.S5(O3)',
+                                  'T','RH','AH'])
+    # Excluding missing values with one combined mask. Missing values of
+    # CO(GT) have always been kept (the column was still a string column
+    # when it was compared to -200), which is not changed here.
+    with datatrace.stage('filter') as stage:
+        missing = np.zeros(len(data), dtype = bool)
+        for col in data.columns.drop('CO(GT)'):
+            missing |= data[col].to_numpy() == -200
+        return stage.done(data[~missing])
@@ -34,14 +34,23 @@ References
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 1
+
 
-def read_all(return_type = 'np', scaling = 'None'):
+@datamemo.memoized(lambda: [basepath + '/UCI_AirFoil'])
+def read_all(return_type = 'np', scaling = 'None', cache = True,
+             return_scaler = False):
     """
     Reads the complete excel sheet and returns it as a 2D Numpy Array or pandas
     DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
@@ -53,8 +62,25 @@ def read_all(return_type = 'np', scaling = 'None'):
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
         If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
@@ -63,20 +89,27 @@ def read_all(return_type = 'np', scaling = 'None'):
     column. Else it is a pandas dataframe with the descriptors given in the
     excel sheet.
     """
-    data = pd.read_csv(basepath + '/UCI_Airfoil/airfoil.csv', sep=';')
-    # Updated columns
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
+    data = datacache.cached_frame(
+        __name__, [basepath + '/UCI_AirFoil/airfoil.csv'],
+        _read_source, version = __cache_version__,
+        cache = cache)
     if return_type == 'np':
-        return data.values
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
     elif return_type == 'pd':
-        return data
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
     else:
         raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source():
+    """ Reads and cleans the source file, see read_all. """
+    return pd.read_csv(basepath + '/UCI_AirFoil/airfoil.csv', sep=';')
 
 
 if __name__ == '__main__':
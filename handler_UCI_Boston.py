@@ -44,15 +44,18 @@ References
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
-from sklearn.datasets import load_boston
+
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
 
-def read_all(return_type = 'np', scaling = 'None'):
+@datamemo.memoized(lambda: [])
+def read_all(return_type = 'np', scaling = 'None', return_scaler = False):
     """
     Reads the complete excel sheet and returns it as a 2D Numpy Array.
     The alleged Y variable (according to the description) is stored in
@@ -63,8 +66,21 @@ def read_all(return_type = 'np', scaling = 'None'):
     return_type : string ('np')
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
@@ -72,13 +88,11 @@ def read_all(return_type = 'np', scaling = 'None'):
     'np', return object is a 2D Numpy Array storing the Y-variable in the last
     column.
     """
-    data = load_boston()['data']
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[:,:-1] = minmaxscaler.fit_transform(data[:,:-1])
-    elif scaling == 'MeanVar':
-        data[:,:-1] = scale(data[:,:-1])
-    if return_type == 'np':
-        return data
-    else:
+    from sklearn.datasets import load_boston
+    with datatrace.stage('parse') as stage:
+        data = stage.done(load_boston()['data'])
+    data, scaler = datascaling.scale(data, slice(None, -1), scaling,
+                                     return_scaler = True)
+    if return_type != 'np':
         raise RuntimeError("Choose return_type = 'np' to read data.")
+    return (data, scaler) if return_scaler else data
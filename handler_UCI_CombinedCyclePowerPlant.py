@@ -50,13 +50,27 @@ import os
 
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 1
+
+# Calls (function, options) run by db_hand.build, see datacache
+__build__ = [('read_all', {}), ('read_permutations', {})]
+
+__source__ = basepath + '/UCI_CombinedCyclePowerPlant/Folds5x2_pp.xlsx'
 
-def read_all(return_type = 'np', scaling = 'None'):
+
+@datamemo.memoized(lambda: [basepath + '/UCI_CombinedCyclePowerPlant'])
+def read_all(return_type = 'np', scaling = 'None', cache = True,
+             return_scaler = False):
     """
     Reads the complete excel sheet and returns it as a 2D Numpy Array or pandas
     DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
@@ -68,8 +82,25 @@ def read_all(return_type = 'np', scaling = 'None'):
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
         If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
@@ -78,17 +109,107 @@ def read_all(return_type = 'np', scaling = 'None'):
     column. Else it is a pandas dataframe with the descriptors given in the
     excel sheet.
     """
-    data = pd.read_excel(basepath + \
-                    '/UCI_CombinedCyclePowerPlant/Folds5x2_pp.xlsx')
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
+    data = datacache.cached_frame(
+        __name__, [__source__], _read_source, version = __cache_version__,
+        cache = cache)
     if return_type == 'np':
-        return data.values
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
     elif return_type == 'pd':
-        return data
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
     else:
         raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def read_permutations(cache = True):
+    """
+    Returns the row orders of the five shuffled sheets of the workbook, which
+    are meant for 5x2-fold cross validation, relative to the data returned by
+    read_all (first sheet).
+
+    Parameters
+    --------------
+    cache : Boolean
+        If True, the permutations are stored in and loaded from the binary
+        cache (see datacache), so the workbook is only parsed once.
+
+    Returns
+    -------------
+    2D Numpy Array of shape (5, n_samples). Row k contains the indices of the
+    rows of read_all in the order of sheet k + 1, i.e.
+    read_all()[read_permutations()[k]] equals sheet k + 1.
+    """
+    permutations = datacache.cached_frame(
+        __name__, [__source__], lambda: _read_permutations(cache),
+        version = __cache_version__, options = {'permutations' : True},
+        cache = cache)
+    return np.ascontiguousarray(permutations.values.T)
+
+
+def iter_folds(return_type = 'np', scaling = 'None', cache = True):
+    """
+    Iterates over the ten train/test splits of 5x2-fold cross validation as
+    given by the five shuffled sheets of the workbook. Each sheet is split
+    into halves, which are used once as training and once as test set.
+
+    The data is loaded once and yielded together with index arrays, which are
+    views of the permutations (see read_permutations), so no data is copied
+    unless the training or test set is selected by the caller.
+
+    Parameters
+    --------------
+    return_type : string ('np' or 'pd')
+        Datatype of the data, see read_all. Select rows by data[train] for
+        'np' and by data.iloc[train] for 'pd'.
+
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data, see read_all.
+
+    cache : Boolean
+        If True, data and permutations are stored in and loaded from the
+        binary cache (see datacache).
+
+    Returns
+    -------------
+    Generator of tuples (data, train, test), where data is the same object
+    in all tuples and train and test are 1D arrays of row indices.
+    """
+    permutations = read_permutations(cache = cache)
+    data = read_all(return_type = return_type, scaling = scaling, cache = cache)
+    n_train = permutations.shape[1] // 2
+    for permutation in permutations:
+        yield data, permutation[:n_train], permutation[n_train:]
+        yield data, permutation[n_train:], permutation[:n_train]
+
+
+def _read_source():
+    """ Reads and cleans the source file, see read_all. """
+    return pd.read_excel(__source__)
+
+
+def _read_permutations(cache):
+    """ Parses all sheets of the workbook and returns the permutations as
+    DataFrame with one column per sheet, see read_permutations. If cache is
+    True, the first sheet is stored in the cache of read_all on the way, so
+    the workbook is parsed once when iter_folds starts without cache entries.
+    """
+    sheets = pd.read_excel(__source__, sheet_name = None)
+    base = sheets['Sheet1']
+    if cache:
+        datacache.cached_frame(__name__, [__source__], lambda: base,
+                               version = __cache_version__)
+    # Rows of the sheets are matched by sorting them lexicographically,
+    # identical rows may be matched in any order
+    base_order = np.lexsort(base.values.T[::-1])
+    permutations = pd.DataFrame(index = range(len(base)))
+    for name in sorted(sheets):
+        values = sheets[name].values
+        permutation = np.empty(len(values), dtype = np.int64)
+        permutation[np.lexsort(values.T[::-1])] = base_order
+        permutations[name] = permutation
+    return permutations
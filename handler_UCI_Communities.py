@@ -90,19 +90,30 @@ __exclude_features__ = [
 
 
 
+import io
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 2
+
 
-def read_all(return_type = 'np', scaling = 'None'):
+@datamemo.memoized(lambda: [basepath + '/UCI_Communities'])
+def read_all(return_type = 'np', scaling = 'None',
+             to_predict = 'ViolentCrimesPerPop', missing = 'None', cache = True,
+             return_scaler = False):
     """
-    Reads the complete excel sheet and returns it as a 2D Numpy Array or pandas
+    Reads the complete csv file and returns it as a 2D Numpy Array or pandas
     DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
     variable (according to the description) is stored in the last column.
 
@@ -110,28 +121,96 @@ def read_all(return_type = 'np', scaling = 'None'):
     --------------
     return_type : string ('np' or 'pd')
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
-        If 'pd', data is returned as a 2D DataFrame
+        If 'pd', data is returned as a 2D DataFrame indexed by communityname.
+
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
+
+    to_predict : string
+        Feature that shall be predicted, i.e. is assigned to the last column of
+        the output data file.
+
+    missing : string 'Drop', 'Mean', 'Median' or 'None'
+        Handling of missing values ('?' in the csv file). 'Drop' removes all
+        rows with a missing value, 'Mean' and 'Median' replace missing values
+        by the column-wise mean or median and 'None' keeps them as NaN.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
-    Returns the data object containing the entire excel sheet. If return_type is
+    Returns the data object containing the entire csv file. If return_type is
     'np', return object is a 2D Numpy Array storing the Y-variable in the last
     column. Else it is a pandas dataframe with the descriptors given in the
-    excel sheet.
+    header of the csv file.
     """
-    data = pd.read_excel(basepath + '/UCI_Communities/crimedata.xls')
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
+    data = datacache.cached_frame(
+        __name__, [basepath + '/UCI_Communities/crimedata.csv'],
+        lambda: _read_source(to_predict), version = __cache_version__,
+        options = {'to_predict' : to_predict},
+        cache = cache)
+    with datatrace.stage('filter') as stage:
+        if missing == 'Drop':
+            data = data[~np.isnan(data.values).any(axis = 1)]
+        elif missing == 'Mean':
+            data = data.fillna(data.mean())
+        elif missing == 'Median':
+            data = data.fillna(data.median())
+        elif missing != 'None':
+            raise RuntimeError("Choose missing = 'Drop', 'Mean', 'Median' or 'None'.")
+        data = stage.done(data, missing = missing)
     if return_type == 'np':
-        return data.values
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
     elif return_type == 'pd':
-        return data
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
     else:
         raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source(to_predict):
+    """ Reads and cleans the source file, see read_all.
+
+    The csv file uses carriage returns as line separators, which are turned
+    into newlines while streaming by opening it in universal newline mode.
+    Excluded features are skipped by the parser and all remaining features
+    are parsed as float64, with '?' marking missing values.
+    """
+    with io.open(basepath + '/UCI_Communities/crimedata.csv', 'r',
+                 encoding = 'mac_roman', newline = None) as f:
+        # First name starts with a non-breaking space
+        names = [name.strip() for name in f.readline().rstrip('\n').split(',')]
+        if to_predict not in names or to_predict in __exclude_features__ or \
+                to_predict == 'communityname':
+            raise RuntimeError("Unknown feature to_predict = '{0}'.".format(
+                to_predict))
+        features = [name for name in names if name != 'communityname' and
+                    name not in __exclude_features__ and name != to_predict]
+        dtypes = dict((name, np.float64) for name in features + [to_predict])
+        dtypes['communityname'] = str
+        data = pd.read_csv(f, header = None, names = names,
+                           usecols = ['communityname'] + features + [to_predict],
+                           index_col = 'communityname', dtype = dtypes,
+                           na_values = '?', keep_default_na = False,
+                           engine = 'c')
+    return data[features + [to_predict]]
@@ -49,19 +49,32 @@ References
 import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler, scale
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
 
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 1
+
+# Calls (function, options) run by db_hand.build, see datacache
+__build__ = [('read_all', {'predict' : predict})
+             for predict in ['motor_UPDRS', 'total_UPDRS']]
+
 __column_names__ = ['subject_nr','age','sex','test_time','motor_UPDRS','total_UPDRS',
                     'Jitter1','Jitter2','Jitter3','Jitter4','Jitter5','Shimmer1',
                     'Shimmer2','Shimmer3','Shimmer4','Shimmer5','Shimmer6',
                     'NHR','HNR','RPDE','DFA','PPE']
 
 
-def read_all(return_type = 'np', scaling = 'None', predict = 'motor_UPDRS'):
+@datamemo.memoized(lambda: [basepath + '/UCI_Parkinsons'])
+def read_all(return_type = 'np', scaling = 'None', predict = 'motor_UPDRS',
+             cache = True, return_scaler = False):
     """
     Reads the complete excel sheet and returns it as a 2D Numpy Array or pandas
     DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
@@ -73,12 +86,29 @@ def read_all(return_type = 'np', scaling = 'None', predict = 'motor_UPDRS'):
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
         If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
 
     predict : string 'motor_UPDRS', or 'total_UPDRS'
         Variable to predict (last column of returned matrix)
 
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
+
     Returns
     -------------
     Returns the data object containing the entire excel sheet. If return_type is
@@ -86,6 +116,27 @@ def read_all(return_type = 'np', scaling = 'None', predict = 'motor_UPDRS'):
     column. Else it is a pandas dataframe with the descriptors given in the
     excel sheet.
     """
+    data = datacache.cached_frame(
+        __name__, [basepath + '/UCI_Parkinsons/parkinsons.txt'],
+        lambda: _read_source(predict), version = __cache_version__,
+        options = {'predict' : predict},
+        cache = cache)
+    if return_type == 'np':
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
+    elif return_type == 'pd':
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
+    else:
+        raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _read_source(predict):
+    """ Reads and cleans the source file, see read_all. """
     data = pd.read_csv(basepath + '/UCI_Parkinsons/parkinsons.txt', sep=',')
     data.columns = __column_names__
     cols = data.columns.tolist()
@@ -97,20 +148,9 @@ def read_all(return_type = 'np', scaling = 'None', predict = 'motor_UPDRS'):
         cols = cols[6:] + [cols[5]]
     else:
         raise RuntimeError('Can only predict motor_UPDRS or total_UPDRS. Choose one.')
-    data = data[cols]
-    # Updated columns
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
-    if return_type == 'np':
-        return data.values
-    elif return_type == 'pd':
-        return data
-    else:
-        raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    with datatrace.stage('reorder') as stage:
+        data = stage.done(data[cols])
+    return data
 
 
 if __name__ == '__main__':
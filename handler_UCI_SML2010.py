@@ -0,0 +1,222 @@
+# coding: utf8
+
+""" Python file with methods to handle the UCI_SML2010 Data set
+
+Remarks
+----------
+Information from UCI WebPage:
+
+Data Set Information:
+=====================
+
+The data set is collected from a monitor system mounted in a domotic house. It
+corresponds to approximately 40 days of monitoring data. The data was sampled
+every minute, computing and uploading it smoothed with 15 minute means.
+
+The data is split into two files (March/April 2012 and April/May 2012). Each
+file is shipped as tab separated .txt file (identical to the original .T15
+files) and as semicolon separated .csv file. In the .csv files the decimal
+point of many values got lost (e.g. 42415 instead of 42.415), therefore only
+the .txt files are read.
+
+Attribute Information:
+======================
+
+1. Date: in UTC.
+2. Time: in UTC.
+3. Indoor temperature (dinning-room), in °C.
+4. Indoor temperature (room), in °C.
+5. Weather forecast temperature, in °C.
+6. Carbon dioxide in ppm (dinning room).
+7. Carbon dioxide in ppm (room).
+8. Relative humidity (dinning room), in %.
+9. Relative humidity (room), in %.
+10. Lighting (dinning room), in Lux.
+11. Lighting (room), in Lux.
+12. Rain, the proportion of the last 15 minutes where rain was detected (a
+    value in range [0,1]).
+13. Sun dusk.
+14. Wind, in m/s.
+15. Sun light in west facade, in Lux.
+16. Sun light in east facade, in Lux.
+17. Sun light in south facade, in Lux.
+18. Sun irradiance, in W/m2.
+19. Enthalpic motor 1, 0 or 1 (on-off).
+20. Enthalpic motor 2, 0 or 1 (on-off).
+21. Enthalpic motor turbo, 0 or 1 (on-off).
+22. Outdoor temperature, in °C.
+23. Outdoor relative humidity, in %.
+24. Day of the week (computed from the date). 1 = Monday, 7 = Sunday.
+
+References
+-----------
+[1] F. Zamora-Martínez, P. Romeu, P. Botella-Rocamora, J. Pardo, On-line
+    learning of indoor temperature forecasting models towards energy
+    efficiency, Energy and Buildings, Volume 83, November 2014, Pages 162-172.
+"""
+import io
+import os
+
+import numpy as np
+import pandas as pd
+
+import datacache
+import datamemo
+import datascaling
+import datatrace
+
+# Get basepath such that only relatives paths matter from this folder on
+basepath = os.path.dirname(os.path.realpath(__file__))
+
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 1
+
+# Calls (function, options) run by db_hand.build, see datacache
+__build__ = [('read_all', {'split' : split}) for split in [1, 2, 'both']]
+
+__column_names__ = [
+    'Date',
+    'Time',
+    'Temperature_Comedor_Sensor',
+    'Temperature_Habitacion_Sensor',
+    'Weather_Temperature',
+    'CO2_Comedor_Sensor',
+    'CO2_Habitacion_Sensor',
+    'Humedad_Comedor_Sensor',
+    'Humedad_Habitacion_Sensor',
+    'Lighting_Comedor_Sensor',
+    'Lighting_Habitacion_Sensor',
+    'Precipitacion',
+    'Meteo_Exterior_Crepusculo',
+    'Meteo_Exterior_Viento',
+    'Meteo_Exterior_Sol_Oest',
+    'Meteo_Exterior_Sol_Est',
+    'Meteo_Exterior_Sol_Sud',
+    'Meteo_Exterior_Piranometro',
+    'Exterior_Entalpic_1',
+    'Exterior_Entalpic_2',
+    'Exterior_Entalpic_turbo',
+    'Temperature_Exterior_Sensor',
+    'Humedad_Exterior_Sensor',
+    'Day_Of_Week'
+]
+
+__exclude_features__ = [
+    'Exterior_Entalpic_1', # Constantly 0 in both files
+    'Exterior_Entalpic_2', # Constantly 0 in both files
+    'Exterior_Entalpic_turbo' # Constantly 0 in both files
+]
+
+__splits__ = {
+    1 : '/UCI_SML2010/UCI_SML2010_1.txt',
+    2 : '/UCI_SML2010/UCI_SML2010_2.txt'
+}
+
+
+@datamemo.memoized(lambda: [basepath + '/UCI_SML2010'])
+def read_all(return_type = 'np', scaling = 'None', split = 'both',
+             to_predict = 'Temperature_Comedor_Sensor', cache = True,
+             return_scaler = False):
+    """
+    Reads the data files and returns them as a 2D Numpy Array or pandas
+    DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
+    variable (according to the description) is stored in the last column.
+
+    Parameters
+    --------------
+    return_type : string ('np' or 'pd')
+        Datatype of return object. If 'np', data is returned as a 2D numpy array.
+        If 'pd', data is returned as a 2D DataFrame indexed by the measurement
+        time (datetime64).
+
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
+
+    split : 1, 2 or 'both'
+        Decides upon which file is loaded. If 'both', both files are parsed in
+        a single pass into one contiguous block of rows (first file first).
+
+    to_predict : string
+        Feature that shall be predicted, i.e. is assigned to the last column of
+        the output data file.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
+
+    Returns
+    -------------
+    Returns the data object containing the selected data. If return_type is
+    'np', return object is a 2D Numpy Array storing the Y-variable in the last
+    column. Else it is a pandas dataframe with the descriptors given in the
+    header of the files.
+    """
+    data = datacache.cached_frame(
+        __name__, [basepath + __splits__[nr] for nr in _split_numbers(split)],
+        lambda: _read_source(split, to_predict), version = __cache_version__,
+        options = {'split' : split, 'to_predict' : to_predict},
+        cache = cache)
+    if return_type == 'np':
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
+    elif return_type == 'pd':
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
+    else:
+        raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _split_numbers(split):
+    """ Returns the list of file numbers for the given split. """
+    if split == 'both':
+        return [1, 2]
+    elif split in __splits__:
+        return [split]
+    raise RuntimeError("Choose split = 1, 2 or 'both' to read data.")
+
+
+def _read_source(split, to_predict):
+    """ Reads and cleans the source files, see read_all.
+
+    The data lines of all selected files are joined and parsed by a single
+    read_csv call with fixed column dtypes, so the rows of both files end up
+    in one float64 block without concatenating DataFrames.
+    """
+    chunks = []
+    for nr in _split_numbers(split):
+        with open(basepath + __splits__[nr], 'rb') as f:
+            # Drop header line, column names are given by __column_names__
+            f.readline()
+            chunks.append(f.read())
+    features = [name for name in __column_names__[2:]
+                if name not in __exclude_features__ or name == to_predict]
+    if to_predict not in features:
+        raise RuntimeError("Unknown feature to_predict = '{0}'.".format(
+            to_predict))
+    dtypes = dict((name, np.float64) for name in features)
+    dtypes.update({'Date' : str, 'Time' : str})
+    data = pd.read_csv(io.BytesIO(b''.join(chunks)), sep = '\t', header = None,
+                       names = __column_names__,
+                       usecols = ['Date', 'Time'] + features, dtype = dtypes,
+                       engine = 'c')
+    data.index = pd.to_datetime(data.pop('Date') + ' ' + data.pop('Time'),
+                                format = '%d/%m/%Y %H:%M')
+    features.remove(to_predict)
+    return data[features + [to_predict]]
@@ -52,15 +52,28 @@ import os
 import numpy as np
 import pandas as pd
 
-from sklearn.preprocessing import MinMaxScaler, scale
+import datacache
+import datamemo
+import datascaling
+import datatrace
+
 
 # Get basepath such that only relatives paths matter from this folder on
 basepath = os.path.dirname(os.path.realpath(__file__))
 
+# Version of the parsing code, see datacache.cached_frame
+__cache_version__ = 2
+
+# Calls (function, options) run by db_hand.build, see datacache
+__build__ = [('read_all', {'wine_color' : color})
+             for color in ['red', 'white', 'both']]
+
 
-def read_all(return_type = 'np', scaling = 'None', wine_color = 'red'):
+@datamemo.memoized(lambda: [basepath + '/UCI_WineQuality'])
+def read_all(return_type = 'np', scaling = 'None', wine_color = 'red',
+             cache = True, return_scaler = False):
     """
-    Reads the complete excel sheet and returns it as a 2D Numpy Array or pandas
+    Reads the complete csv file and returns it as a 2D Numpy Array or pandas
     DataFrame. If 2D Numpy Array is chosen as return type, the alleged Y
     variable (according to the description) is stored in the last column.
 
@@ -70,35 +83,91 @@ def read_all(return_type = 'np', scaling = 'None', wine_color = 'red'):
         Datatype of return object. If 'np', data is returned as a 2D numpy array.
         If 'pd', data is returned as a 2D DataFrame
 
-    scaling : string 'MinMax', 'MeanVar', or 'None'
-        Determines the column-wise scaling of the data.
+    scaling : string 'MinMax', 'MeanVar', 'None' or datascaling.Scaler
+        Determines the column-wise scaling of the data. A Scaler fitted before
+        (see datascaling.fit) is applied without fitting it again.
 
-    wine_color : string 'red' or 'white'
+    wine_color : string 'red', 'white' or 'both'
         Decides upon which data set is loaded, i.e. red wine data set, or white
-        wine data set.
+        wine data set. If 'both', the red wines are followed by the white wines
+        and the feature 'is_red' (1 for red, 0 for white) is inserted before
+        the quality.
+
+    cache : Boolean
+        If True, the parsed and cleaned data is stored in and loaded from the
+        binary cache (see datacache), so the source is only parsed once.
+
+    return_scaler : Boolean
+        If True, the tuple (data, scaler) is returned, where scaler is the
+        datascaling.Scaler applied to the features (None if scaling =
+        'None'). It can be passed as scaling to scale other splits or batches
+        without fitting again.
+
+    memo : Boolean or None
+        If True, the result is kept in the process-wide memo (see datamemo).
+        Its arrays are then read-only, copy them to change them in place. If
+        None, the memo is used if enabled by DB_HAND_MEMO=1 or
+        datamemo.enable().
 
     Returns
     -------------
-    Returns the data object containing the entire excel sheet. If return_type is
+    Returns the data object containing the entire csv file. If return_type is
     'np', return object is a 2D Numpy Array storing the Y-variable in the last
     column. Else it is a pandas dataframe with the descriptors given in the
-    excel sheet.
+    header of the csv file.
     """
-    if wine_color == 'red':
-        data = pd.read_excel(basepath + '/UCI_WineQuality/winequality-red.xlsx',
-                              header = [1])
-    elif wine_color == 'white':
-        data = pd.read_excel(basepath + '/UCI_WineQuality/WineQuality-white.xlsx',
-                            header = [1])
-    cols = data.columns.tolist()
-    if scaling == 'MinMax':
-        minmaxscaler = MinMaxScaler(feature_range=(-1, 1))
-        data[cols[:-1]] = minmaxscaler.fit_transform(data[cols[:-1]])
-    elif scaling == 'MeanVar':
-        data[cols[:-1]] = scale(data[cols[:-1]])
+    data = datacache.cached_frame(
+        __name__, _source_filenames(wine_color),
+        lambda: _read_source(wine_color), version = __cache_version__,
+        options = {'wine_color' : wine_color},
+        cache = cache)
     if return_type == 'np':
-        return data.values
+        with datatrace.stage('convert') as stage:
+            data = stage.done(data.values)
+        # The features of the array are scaled in place
+        data, scaler = datascaling.scale(data, slice(0, -1), scaling,
+                                         return_scaler = True)
     elif return_type == 'pd':
-        return data
+        data, scaler = datascaling.scale(data, data.columns[:-1], scaling,
+                                         return_scaler = True)
     else:
         raise RuntimeError("Choose return_type = 'np' or 'pd' to read data.")
+    return (data, scaler) if return_scaler else data
+
+
+def _source_filenames(wine_color):
+    """ Returns the filenames of the source files of the given wine color. The
+    csv files are preferred, the excel sheets are only used if they are
+    missing. """
+    if wine_color == 'both':
+        return _source_filenames('red') + _source_filenames('white')
+    elif wine_color not in ['red', 'white']:
+        raise RuntimeError("Choose wine_color = 'red', 'white' or 'both'.")
+    fn = basepath + '/UCI_WineQuality/winequality-' + wine_color
+    if os.path.isfile(fn + '.csv'):
+        return [fn + '.csv']
+    return [fn + '.xlsx']
+
+
+def _read_file(fn):
+    """ Reads a single csv file or excel sheet. """
+    if fn.endswith('.csv'):
+        return pd.read_csv(fn, sep = ';', engine = 'c')
+    return pd.read_excel(fn, header = [1])
+
+
+def _read_source(wine_color):
+    """ Reads and cleans the source files, see read_all. """
+    if wine_color != 'both':
+        return _read_file(_source_filenames(wine_color)[0])
+    red, white = [_read_file(fn) for fn in _source_filenames(wine_color)]
+    cols = red.columns.tolist()
+    # Fill one preallocated array instead of concatenating DataFrames
+    values = np.empty((len(red) + len(white), len(cols) + 1))
+    values[:len(red), :-2] = red[cols[:-1]].values
+    values[len(red):, :-2] = white[cols[:-1]].values
+    values[:len(red), -2] = 1
+    values[len(red):, -2] = 0
+    values[:len(red), -1] = red[cols[-1]].values
+    values[len(red):, -1] = white[cols[-1]].values
+    return pd.DataFrame(values, columns = cols[:-1] + ['is_red', cols[-1]])